@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,7 +55,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
 ]
 
-CORS_ALLOW_ALL_ORIGINS = True
+# Only the frontend may make credentialed requests (comma-separated origins)
+CORS_ALLOWED_ORIGINS = os.getenv('LEADZEPPELIN_FRONTEND_ORIGINS', 'http://localhost:3000').split(',')
+# Browsers send the session cookie that keys per-user detector state
+CORS_ALLOW_CREDENTIALS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -133,3 +137,21 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging
+# Frame-pipeline diagnostics are logged at DEBUG, sampled every
+# LEADZEPPELIN_DEBUG_SAMPLE_EVERY frames; see vision_api/instrumentation.py
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'vision_api': {
+            'handlers': ['console'],
+            'level': os.getenv('LEADZEPPELIN_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,175 @@
+"""
+Audio output backends for triggered notes.
+
+SquareDetector never talks to an audio device directly; it hands the note's
+PCM to an ``AudioSink``:
+
+* ``PygameSink`` plays through the local sound card (the original behaviour).
+* ``NullSink`` only records what would have been played, for headless servers
+  and for measuring CV throughput without mixer latency.
+* ``OfflineRenderSink`` mixes every triggered note into a PCM buffer at its
+  trigger timestamp, which can be written out as a WAV file.
+* ``MixerSink`` (in ``mixer.py``) mixes voices in software with bounded
+  polyphony and streams the result to the sound card.
+
+The process-wide default is chosen with ``LEADZEPPELIN_AUDIO_SINK``
+(``pygame``, ``mixer``, ``null`` or ``offline``); if pygame cannot open a device the
+default falls back to ``NullSink``.
+"""
+
+import abc
+import logging
+import os
+import threading
+import time
+import wave
+from collections import deque
+
+import numpy as np
+
+from .synthesis import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class AudioSink(abc.ABC):
+    """Interface for anything that can receive triggered notes"""
+
+    sample_rate = SAMPLE_RATE
+
+    @abc.abstractmethod
+    def play(self, note, pcm, gain=1.0, timestamp=None):
+        """Start playing ``pcm`` (int16, shape (frames, 2)) for ``note``"""
+
+    def close(self):
+        """Release any device or buffers held by the sink"""
+
+
+class PygameSink(AudioSink):
+    """Plays notes on the local sound card through pygame.mixer"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, buffer=512):
+        import pygame
+
+        self._pygame = pygame
+        self.sample_rate = sample_rate
+        pygame.mixer.init(frequency=sample_rate, size=-16, channels=2, buffer=buffer)
+        # id(pcm) -> (pcm, Sound); holding pcm keeps the id from being reused
+        self._sounds = {}
+        self._lock = threading.Lock()
+
+    def _sound_for(self, pcm):
+        with self._lock:
+            entry = self._sounds.get(id(pcm))
+            if entry is None:
+                sound = self._pygame.sndarray.make_sound(np.ascontiguousarray(pcm))
+                entry = self._sounds[id(pcm)] = (pcm, sound)
+            return entry[1]
+
+    def play(self, note, pcm, gain=1.0, timestamp=None):
+        channel = self._sound_for(pcm).play()
+        if channel is not None:
+            channel.set_volume(gain)
+
+    def close(self):
+        self._sounds.clear()
+        self._pygame.mixer.quit()
+
+
+class NullSink(AudioSink):
+    """Discards audio and keeps a bounded log of play events"""
+
+    def __init__(self, max_events=1000):
+        self.events = deque(maxlen=max_events)
+
+    def play(self, note, pcm, gain=1.0, timestamp=None):
+        self.events.append({
+            'timestamp': timestamp if timestamp is not None else time.time(),
+            'note': note,
+            'gain': gain,
+            'frames': len(pcm),
+        })
+
+
+class OfflineRenderSink(AudioSink):
+    """Mixes triggered notes into a PCM timeline that can be rendered or saved as WAV"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, start_time=None):
+        self.sample_rate = sample_rate
+        self.start_time = start_time
+        self._events = []
+        self._lock = threading.Lock()
+
+    def play(self, note, pcm, gain=1.0, timestamp=None):
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            if self.start_time is None:
+                self.start_time = timestamp
+            offset = max(0, int(round((timestamp - self.start_time) * self.sample_rate)))
+            self._events.append((offset, pcm, gain))
+
+    def render(self):
+        """Return the mixed int16 stereo timeline of everything played so far"""
+        with self._lock:
+            events = list(self._events)
+        if not events:
+            return np.zeros((0, 2), dtype=np.int16)
+
+        length = max(offset + len(pcm) for offset, pcm, _ in events)
+        mix = np.zeros((length, 2), dtype=np.float32)
+        for offset, pcm, gain in events:
+            mix[offset:offset + len(pcm)] += pcm * np.float32(gain)
+        return np.clip(mix, -32768, 32767).astype(np.int16)
+
+    def write_wav(self, path):
+        """Write the rendered timeline as a 16-bit stereo WAV file"""
+        pcm = self.render()
+        with wave.open(str(path), 'wb') as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(pcm.tobytes())
+        return path
+
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self.start_time = None
+
+
+def _mixer_sink():
+    from .mixer import MixerSink
+    return MixerSink()
+
+
+AUDIO_SINKS = {
+    'pygame': PygameSink,
+    'mixer': _mixer_sink,
+    'null': NullSink,
+    'offline': OfflineRenderSink,
+}
+
+
+def create_audio_sink(kind=None):
+    """Build a sink by name, falling back to NullSink if the device cannot be opened"""
+    kind = kind or os.getenv('LEADZEPPELIN_AUDIO_SINK', 'pygame')
+    if kind not in AUDIO_SINKS:
+        raise ValueError(f"Unknown audio sink '{kind}'. Available: {list(AUDIO_SINKS)}")
+    try:
+        return AUDIO_SINKS[kind]()
+    except Exception as e:
+        logger.warning("Audio sink '%s' unavailable (%s); using the null sink", kind, e)
+        return NullSink()
+
+
+_default_sink = None
+_default_sink_lock = threading.Lock()
+
+
+def get_default_sink():
+    """Process-wide sink shared by every detector"""
+    global _default_sink
+    with _default_sink_lock:
+        if _default_sink is None:
+            _default_sink = create_audio_sink()
+        return _default_sink
@@ -0,0 +1,235 @@
+"""
+Encode-once fan-out of the annotated video streams.
+
+A ``FrameBroadcaster`` runs one capture/analyze/render pipeline per detector
+while anyone is watching and hands the same multipart JPEG chunk to every
+subscriber. Each subscriber has a small bounded queue; a slow viewer loses its
+oldest frames without holding back the others. Outputs ('overlay',
+'threshold') are only encoded while they have subscribers.
+
+The loop is staged: the shared capture thread reads the camera, the
+broadcaster's analyze thread runs detection, tracking and touch handling, and
+a render thread draws and encodes. Stages hand over through single-item
+``LatestSlot``s, so a slow encode never delays the next analysis; the render
+stage always works on the newest analyzed frame and skipped ones are counted.
+Throughput is that of the slowest stage rather than the sum of all of them.
+"""
+
+import logging
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .capture import captures
+from .events import Subscription
+from .registry import DETECTOR_INSTRUMENTS, detectors
+
+logger = logging.getLogger(__name__)
+
+STREAM_OUTPUTS = ('overlay', 'threshold')
+
+
+def open_default_camera():
+    """Subscription to the shared capture of camera 0"""
+    return captures.subscribe(0)
+
+
+def multipart_chunk(jpeg):
+    return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n'
+
+
+class LatestSlot:
+    """Single-item hand-over between two stages: a newer item replaces an unconsumed one"""
+
+    def __init__(self):
+        self.overwritten = 0
+        self._item = None
+        self._closed = False
+        self._ready = threading.Condition()
+
+    def put(self, item):
+        with self._ready:
+            if self._item is not None:
+                self.overwritten += 1
+            self._item = item
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Newest item, or None once the slot is closed and empty (or on timeout)"""
+        with self._ready:
+            if self._item is None and not self._closed:
+                self._ready.wait(timeout)
+            item, self._item = self._item, None
+            return item
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+
+
+class FrameBroadcaster:
+    """One processing loop for a detector, shared by all of its stream viewers"""
+
+    def __init__(self, name, detector_factory=None, source_factory=open_default_camera, max_queue=2):
+        self.name = name
+        self.detector_factory = detector_factory or (lambda: detectors.get(name))
+        self.source_factory = source_factory
+        self.max_queue = max_queue
+        self.frames = 0
+        self.rendered = 0
+        self.render_skipped = 0
+        self.latency = 0.0  # Smoothed capture-to-publish seconds
+        self.encoded = {output: 0 for output in STREAM_OUTPUTS}
+        self._subscribers = {output: set() for output in STREAM_OUTPUTS}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, output='overlay'):
+        """Queue of multipart JPEG chunks for ``output``; starts the loop if it is idle"""
+        if output not in STREAM_OUTPUTS:
+            raise KeyError(f"Unknown stream output '{output}'. Available: {list(STREAM_OUTPUTS)}")
+        subscription = Subscription(self, output, self.max_queue)
+        with self._lock:
+            self._subscribers[output].add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"broadcast-{self.name}", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers[subscription.session_id].discard(subscription)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(s) for s in self._subscribers.values())
+
+    def _targets(self):
+        with self._lock:
+            return {output: list(subs) for output, subs in self._subscribers.items() if subs}
+
+    def _run(self):
+        """Analyze stage; the render/encode stage runs on its own thread behind a LatestSlot"""
+        source = self.source_factory()
+        detector = self.detector_factory()
+        slot = LatestSlot()
+        renderer = threading.Thread(target=self._render_loop, args=(detector, slot),
+                                    name=f"render-{self.name}", daemon=True)
+        renderer.start()
+        try:
+            while True:
+                with self._lock:
+                    if not any(self._subscribers.values()):
+                        # Last viewer left: stop and release the camera
+                        self._thread = None
+                        return
+                ret, frame = source.read()
+                if not ret:
+                    logger.warning("Stream source for %s ended", self.name)
+                    break
+                slot.put(detector.analyze_frame(frame, getattr(source, 'last_timestamp', None) or time.time()))
+                self.frames += 1
+        finally:
+            # Detach this loop's viewers first: anyone subscribing from here on starts a new loop
+            orphans = self._detach()
+            source.release()
+            slot.close()
+            renderer.join()
+            self.render_skipped = slot.overwritten
+            for subscription in orphans:
+                subscription.close()
+
+    def _render_loop(self, detector, slot):
+        while True:
+            analysis = slot.get()
+            if analysis is None:
+                if slot.closed:
+                    return
+                continue
+            targets = self._targets()
+            if targets:
+                self.publish_analysis(detector, analysis, targets)
+            self.render_skipped = slot.overwritten
+
+    def publish_analysis(self, detector, analysis, targets):
+        """Render and encode once per output and deliver the same bytes to every subscriber"""
+        for output, subscribers in targets.items():
+            if output == 'overlay':
+                image = analysis.frame if analysis.warming_up else detector.render_frame(analysis)
+            elif analysis.warming_up:
+                image = np.zeros_like(analysis.frame)
+            else:
+                image = cv2.cvtColor(analysis.thresh, cv2.COLOR_GRAY2BGR)
+            chunk = multipart_chunk(detector.encode_jpeg(image))
+            self.encoded[output] += 1
+            for subscription in subscribers:
+                subscription.put(chunk)
+        self.rendered += 1
+        delay = time.time() - analysis.timestamp
+        self.latency = delay if self.rendered == 1 else self.latency + 0.1 * (delay - self.latency)
+
+    def _detach(self):
+        """Stop accepting viewers into the exiting loop and return the ones it still has"""
+        with self._lock:
+            if self._thread is not threading.current_thread():
+                return []  # Stopped idle; later subscribers belong to the next loop
+            self._thread = None
+            return [sub for subs in self._subscribers.values() for sub in subs]
+
+    def stream(self, output='overlay', timeout=5.0):
+        """Generator of multipart chunks for one HTTP response"""
+        subscription = self.subscribe(output)
+        try:
+            while not subscription.closed or subscription.depth:
+                chunk = subscription.get(timeout=timeout)
+                if chunk is not None:
+                    yield chunk
+        finally:
+            subscription.close()
+
+    def stats(self):
+        with self._lock:
+            subscribers = {output: [sub.metrics() for sub in subs] for output, subs in self._subscribers.items()}
+            running = self._thread is not None
+        return {
+            'running': running,
+            'frames': self.frames,
+            'rendered': self.rendered,
+            'render_skipped': self.render_skipped,
+            'latency_ms': self.latency * 1000,
+            'encoded': dict(self.encoded),
+            'subscribers': subscribers,
+        }
+
+
+class BroadcasterRegistry:
+    """One broadcaster per detector name, created on first use"""
+
+    def __init__(self, **options):
+        self.options = options
+        self._broadcasters = {}
+        self._lock = threading.Lock()
+
+    def get(self, name='default'):
+        if name not in DETECTOR_INSTRUMENTS:
+            raise KeyError(f"Unknown detector '{name}'. Available: {list(DETECTOR_INSTRUMENTS)}")
+        with self._lock:
+            broadcaster = self._broadcasters.get(name)
+            if broadcaster is None:
+                broadcaster = self._broadcasters[name] = FrameBroadcaster(name, **self.options)
+            return broadcaster
+
+    def stats(self):
+        with self._lock:
+            broadcasters = sorted(self._broadcasters.items())
+        return {name: broadcaster.stats() for name, broadcaster in broadcasters}
+
+
+broadcasters = BroadcasterRegistry()
@@ -0,0 +1,189 @@
+"""
+Shared camera capture.
+
+A ``CaptureService`` owns one device. While it has subscribers a background
+thread reads frames into a small ring of the latest frames; when the last
+subscriber leaves the device is released. Subscribers read through a
+``CaptureSubscription``, which looks like a ``VideoCapture`` (``read()`` /
+``release()``) and returns the newest frame it has not seen yet; frames it was
+too slow for are counted as dropped. Frames are shared and read-only.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureSubscription:
+    """One consumer of a capture service, usable wherever a VideoCapture is"""
+
+    def __init__(self, service):
+        self.service = service
+        self.last_seq = 0
+        self.last_timestamp = None
+        self.frames = 0
+        self.dropped = 0
+        self.closed = False
+
+    def read(self, timeout=5.0):
+        """``(True, frame)`` for the newest unseen frame, ``(False, None)`` once the device is gone"""
+        item = self.service.wait_for_frame(self.last_seq, timeout, self)
+        if item is None:
+            return False, None
+        seq, timestamp, frame = item
+        if self.last_seq:
+            self.dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.last_timestamp = timestamp
+        self.frames += 1
+        return True, frame
+
+    def release(self):
+        if not self.closed:
+            self.closed = True
+            self.service.unsubscribe(self)
+
+    def metrics(self):
+        return {'frames': self.frames, 'dropped': self.dropped}
+
+
+class CaptureService:
+    """Reads one device on a background thread while anyone is subscribed"""
+
+    def __init__(self, device=0, capture_factory=cv2.VideoCapture, ring_size=2):
+        self.device = device
+        self.capture_factory = capture_factory
+        self.frames_read = 0
+        self.read_failures = 0
+        self.fps = 0.0
+        self._ring = deque(maxlen=ring_size)
+        self._seq = 0
+        self._subscribers = set()
+        self._ready = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._device_lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = CaptureSubscription(self)
+        with self._ready:
+            self._subscribers.add(subscription)
+            if self._thread is None:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name=f"capture-{self.device}", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._ready:
+            self._subscribers.discard(subscription)
+            self._ready.notify_all()
+
+    def subscriber_count(self):
+        with self._ready:
+            return len(self._subscribers)
+
+    def wait_for_frame(self, after_seq, timeout, subscription):
+        """Newest ``(seq, timestamp, frame)`` with seq > ``after_seq``, or None if the device stopped"""
+        deadline = time.monotonic() + timeout
+        with self._ready:
+            while not subscription.closed:
+                if self._ring and self._ring[-1][0] > after_seq:
+                    return self._ring[-1]
+                remaining = deadline - time.monotonic()
+                if not self._running or remaining <= 0:
+                    return None
+                self._ready.wait(remaining)
+        return None
+
+    def _run(self):
+        # A previous thread may still be releasing the device
+        with self._device_lock:
+            capture = self.capture_factory(self.device)
+            try:
+                self._read_loop(capture)
+            finally:
+                self._stop()
+                capture.release()
+                logger.info("Released capture device %s", self.device)
+
+    def _read_loop(self, capture):
+        last = None
+        while True:
+            with self._ready:
+                if not self._subscribers:
+                    # Stop under the lock so a new subscriber always starts a fresh thread
+                    self._stop_locked()
+                    return
+            ret, frame = capture.read()
+            if not ret:
+                self.read_failures += 1
+                logger.warning("Capture device %s stopped delivering frames", self.device)
+                return
+            now = time.time()
+            frame.flags.writeable = False  # Shared by every subscriber
+            if last is not None and now > last:
+                rate = 1.0 / (now - last)
+                self.fps = rate if not self.fps else self.fps + 0.1 * (rate - self.fps)
+            last = now
+            with self._ready:
+                self._seq += 1
+                self.frames_read += 1
+                self._ring.append((self._seq, now, frame))
+                self._ready.notify_all()
+
+    def _stop(self):
+        with self._ready:
+            self._stop_locked()
+
+    def _stop_locked(self):
+        if self._thread is threading.current_thread():
+            self._running = False
+            self._thread = None
+            self._ring.clear()
+            self._ready.notify_all()
+
+    def stats(self):
+        with self._ready:
+            subscribers = [sub.metrics() for sub in self._subscribers]
+            running = self._running
+        return {
+            'running': running,
+            'fps': self.fps,
+            'frames_read': self.frames_read,
+            'read_failures': self.read_failures,
+            'dropped': sum(sub['dropped'] for sub in subscribers),
+            'subscribers': subscribers,
+        }
+
+
+class CaptureRegistry:
+    """One capture service per device"""
+
+    def __init__(self, capture_factory=cv2.VideoCapture):
+        self.capture_factory = capture_factory
+        self._services = {}
+        self._lock = threading.Lock()
+
+    def get(self, device=0):
+        with self._lock:
+            service = self._services.get(device)
+            if service is None:
+                service = self._services[device] = CaptureService(device, self.capture_factory)
+            return service
+
+    def subscribe(self, device=0):
+        return self.get(device).subscribe()
+
+    def stats(self):
+        with self._lock:
+            services = sorted(self._services.items())
+        return {str(device): service.stats() for device, service in services}
+
+
+captures = CaptureRegistry()
@@ -1,27 +1,121 @@
 import cv2
 import numpy as np
-import pygame
+import logging
 import threading
 import time
 
+from . import synthesis
+from .audio_output import get_default_sink
+from .frame_context import FrameAnalysis, FrameContext
+from .instrumentation import PipelineStats
+from .note_layout import NoteLayout
+from .overlay import OverlayLayer
+from .sample_cache import get_sample_bank
+from .tracking import SquareTracker
+from .verifier import square_verifier
+
+logger = logging.getLogger(__name__)
+
+# Shared, read-only morphology kernels
+CLOSE_KERNEL = np.ones((3, 3), np.uint8)
+MOTION_KERNEL = np.ones((7, 7), np.uint8)
+
+# The size gates below are tuned for a 640 px wide frame
+REFERENCE_WIDTH = 640
+
+
+class DetectionGeometry:
+    """Detection-resolution frame size and the square size gates scaled to it"""
+    
+    def __init__(self, frame_width, frame_height, detection_width=None):
+        # Never upscale; detection_width=None means detect at full resolution
+        self.scale = min(1.0, detection_width / frame_width) if detection_width else 1.0
+        self.width = int(round(frame_width * self.scale))
+        self.height = int(round(frame_height * self.scale))
+        
+        gate = self.width / REFERENCE_WIDTH
+        self.min_area, self.max_area = 1500 * gate * gate, 8000 * gate * gate
+        self.min_side, self.max_side = 30 * gate, 120 * gate
+        self.margin = 40 * gate
+
+
+def region_fractions(integral, bboxes):
+    """Fraction of set pixels in each (x, y, w, h) box, read from the integral image of a 0/1 mask.
+    
+    Every box costs four lookups regardless of its area. Boxes that are empty
+    or fall outside the mask get NaN.
+    """
+    boxes = np.asarray(bboxes, dtype=np.int64).reshape(-1, 4)
+    x0, y0, w, h = boxes.T
+    x1, y1 = x0 + w, y0 + h
+    height, width = integral.shape[0] - 1, integral.shape[1] - 1
+    valid = (x0 >= 0) & (y0 >= 0) & (w > 0) & (h > 0) & (x1 <= width) & (y1 <= height)
+    
+    fractions = np.full(len(boxes), np.nan)
+    if valid.any():
+        x0, y0, x1, y1 = x0[valid], y0[valid], x1[valid], y1[valid]
+        counts = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        fractions[valid] = counts / ((x1 - x0) * (y1 - y0))
+    return fractions
+
 
 class SquareDetector:
-    def __init__(self, instrument_type="piano"):
+    DEFAULT_NOTES = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
+
+    def __init__(self, instrument_type="piano", instrument_sounds=None, audio_sink=None, event_channel=None,
+                 incremental=True, full_scan_interval=15, roi_padding=24,
+                 detection_width=REFERENCE_WIDTH, refine=True, verifier=None):
         self.sound_cooldown = {}
-        self.registered_square_positions = {}
+        self.tracker = SquareTracker()  # Persistent square ids across frames
         self.finger_in_square = {}
+        self.square_motion = {}  # Last motion fraction per square, for onset speed
         self.frame_count = 0
         
         # Instrument configuration
         self.instrument_type = instrument_type
         
-        # Square-to-note mapping
-        self.square_note_assignments = {}
-        self.available_notes = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
-        
-        # Initialize pygame for sound
-        pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-        self.instrument_sounds = self.load_instrument_sounds()
+        # Square-to-note mapping, updated only when squares appear/disappear or the scale changes
+        self.available_notes = list(self.DEFAULT_NOTES)
+        self.note_layout = NoteLayout(self.available_notes)
+        self.square_note_assignments = self.note_layout.assignments
+        
+        # Notes go to an audio sink (pygame, null or offline); a shared bank can be passed in by the registry
+        self.audio_sink = audio_sink if audio_sink is not None else get_default_sink()
+        self.instrument_sounds = instrument_sounds if instrument_sounds is not None else self.load_instrument_sounds()
+        
+        # Optional callable that receives a note event for every triggered note
+        self.event_channel = event_channel
+        
+        # Per-stage timings and detection counters (see /api/detector-stats/)
+        self.stats = PipelineStats()
+        
+        # Incremental mode: once squares are stable only their padded ROIs are
+        # re-validated; a full-frame scan runs every full_scan_interval frames
+        # or when the scene changes globally (camera or paper moved)
+        self.incremental = incremental
+        self.full_scan_interval = full_scan_interval
+        self.roi_padding = roi_padding
+        self.frames_since_full_scan = 0
+        self.scene_thumbnail = None
+        
+        # Detection runs on a frame downscaled to detection_width with the size
+        # gates scaled to match; results are mapped back to full resolution and
+        # optionally refined there inside each square's bbox
+        self.detection_width = detection_width
+        self.refine = refine
+        self.geometry = None
+        self.geometry_size = None
+        
+        # Touch detection background: float32 running average of gray frames
+        self.background = None
+        
+        # Static annotations, re-rendered only when squares, notes or instrument change
+        self.overlay = OverlayLayer()
+        self.overlay_tolerance = 4  # px a drawn box may drift before the layer is redrawn
+        
+        # Optional CNN check of new tracks (see verifier.py); verdicts are kept per track id
+        self.verifier = verifier if verifier is not None else (square_verifier if square_verifier.enabled else None)
+        self.square_verdicts = {}
         
     def load_instrument_sounds(self):
         """Load sounds based on instrument type"""
@@ -36,152 +130,35 @@ class SquareDetector:
     
     def load_piano_sounds(self):
         """Load piano note sounds"""
-        notes = {}
-        note_names = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
-        base_frequency = 261.63  # C4
-        
-        for i, note in enumerate(note_names):
-            frequency = base_frequency * (2 ** (i / 12))
-            notes[note] = self.generate_piano_tone(frequency, 0.8)
-        
-        return notes
+        return get_sample_bank("piano")
     
     def load_drum_sounds(self):
         """Load drum sounds - different percussion for each 'note'"""
-        drums = {}
-        # Map musical notes to drum sounds with different frequencies and characteristics
-        drum_mapping = {
-            'C': {'freq': 80, 'type': 'kick'},      # Kick drum
-            'D': {'freq': 120, 'type': 'snare'},    # Snare
-            'E': {'freq': 200, 'type': 'hihat'},    # Hi-hat
-            'F': {'freq': 150, 'type': 'tom1'},     # Tom 1
-            'G': {'freq': 100, 'type': 'tom2'},     # Tom 2
-            'A': {'freq': 250, 'type': 'crash'},    # Crash
-            'B': {'freq': 220, 'type': 'ride'},     # Ride
-            'Db': {'freq': 80, 'type': 'kick'},     # Alternative kick
-            'Eb': {'freq': 140, 'type': 'snare'},   # Alternative snare
-            'Gb': {'freq': 180, 'type': 'tom3'},    # Tom 3
-            'Ab': {'freq': 220, 'type': 'hihat'},   # Open hi-hat
-            'Bb': {'freq': 280, 'type': 'crash'}    # Splash
-        }
-        
-        for note, drum_info in drum_mapping.items():
-            drums[note] = self.generate_drum_sound(drum_info['freq'], drum_info['type'])
-        
-        return drums
+        return get_sample_bank("drums")
     
     def load_flute_sounds(self):
         """Load flute sounds - pure sine waves with harmonic overtones"""
-        notes = {}
-        note_names = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
-        base_frequency = 523.25  # C5 (higher octave for flute)
-        
-        for i, note in enumerate(note_names):
-            frequency = base_frequency * (2 ** (i / 12))
-            notes[note] = self.generate_flute_tone(frequency, 1.0)
-        
-        return notes
+        return get_sample_bank("flute")
     
     def generate_piano_tone(self, frequency, duration):
         """Generate piano-like tone with attack and decay"""
-        sample_rate = 22050
-        frames = int(duration * sample_rate)
-        arr = np.zeros(frames)
-        
-        for i in range(frames):
-            # Piano has complex harmonics
-            fundamental = np.sin(2 * np.pi * frequency * i / sample_rate)
-            second_harmonic = 0.5 * np.sin(2 * np.pi * frequency * 2 * i / sample_rate)
-            third_harmonic = 0.25 * np.sin(2 * np.pi * frequency * 3 * i / sample_rate)
-            
-            # Apply envelope (attack and decay)
-            envelope = np.exp(-3 * i / frames)  # Exponential decay
-            if i < frames * 0.1:  # Attack phase
-                envelope *= (i / (frames * 0.1))
-            
-            arr[i] = (fundamental + second_harmonic + third_harmonic) * envelope
-        
-        arr = (arr * 16383).astype(np.int16)  # Reduced volume
-        stereo_arr = np.zeros((frames, 2), dtype=np.int16)
-        stereo_arr[:, 0] = arr
-        stereo_arr[:, 1] = arr
-        
-        return pygame.sndarray.make_sound(stereo_arr)
+        return synthesis.render_piano_tone(frequency, duration)
     
     def generate_drum_sound(self, frequency, drum_type):
         """Generate drum sounds with different characteristics"""
-        sample_rate = 22050
-        duration = 0.3  # Shorter duration for drums
-        frames = int(duration * sample_rate)
-        arr = np.zeros(frames)
-        
-        if drum_type == 'kick':
-            # Low frequency with quick decay
-            for i in range(frames):
-                envelope = np.exp(-8 * i / frames)
-                arr[i] = np.sin(2 * np.pi * frequency * i / sample_rate) * envelope
-        
-        elif drum_type == 'snare':
-            # Mix of tone and noise
-            for i in range(frames):
-                envelope = np.exp(-5 * i / frames)
-                tone = np.sin(2 * np.pi * frequency * i / sample_rate)
-                noise = np.random.normal(0, 0.3)
-                arr[i] = (0.3 * tone + 0.7 * noise) * envelope
-        
-        elif drum_type == 'hihat':
-            # High frequency noise
-            for i in range(frames):
-                envelope = np.exp(-10 * i / frames)
-                noise = np.random.normal(0, 0.5)
-                high_freq = np.sin(2 * np.pi * frequency * i / sample_rate)
-                arr[i] = (0.2 * high_freq + 0.8 * noise) * envelope
-        
-        else:  # toms, crash, ride
-            # Metallic sound with overtones
-            for i in range(frames):
-                envelope = np.exp(-4 * i / frames)
-                fundamental = np.sin(2 * np.pi * frequency * i / sample_rate)
-                overtone = 0.3 * np.sin(2 * np.pi * frequency * 1.6 * i / sample_rate)
-                arr[i] = (fundamental + overtone) * envelope
-        
-        arr = (arr * 20000).astype(np.int16)  # Higher volume for drums
-        stereo_arr = np.zeros((frames, 2), dtype=np.int16)
-        stereo_arr[:, 0] = arr
-        stereo_arr[:, 1] = arr
-        
-        return pygame.sndarray.make_sound(stereo_arr)
+        return synthesis.render_drum_sound(frequency, drum_type)
     
     def generate_flute_tone(self, frequency, duration):
         """Generate flute-like tone - pure and airy"""
-        sample_rate = 22050
-        frames = int(duration * sample_rate)
-        arr = np.zeros(frames)
-        
-        for i in range(frames):
-            # Flute is mostly fundamental with some second harmonic
-            fundamental = np.sin(2 * np.pi * frequency * i / sample_rate)
-            second_harmonic = 0.2 * np.sin(2 * np.pi * frequency * 2 * i / sample_rate)
-            
-            # Add slight breathiness (noise)
-            breath = np.random.normal(0, 0.05)
-            
-            # Gentle attack and sustain
-            if i < frames * 0.15:  # Attack
-                envelope = i / (frames * 0.15)
-            elif i > frames * 0.8:  # Release
-                envelope = (frames - i) / (frames * 0.2)
-            else:  # Sustain
-                envelope = 1.0
-            
-            arr[i] = (fundamental + second_harmonic + breath) * envelope
-        
-        arr = (arr * 12000).astype(np.int16)  # Moderate volume
-        stereo_arr = np.zeros((frames, 2), dtype=np.int16)
-        stereo_arr[:, 0] = arr
-        stereo_arr[:, 1] = arr
+        return synthesis.render_flute_tone(frequency, duration)
+    
+    def memory_bytes(self):
+        """Approximate per-session memory: background model, overlay layer and tracker arrays.
         
-        return pygame.sndarray.make_sound(stereo_arr)
+        Sound banks are shared memory-mapped files and are not counted.
+        """
+        arrays = (self.background, self.scene_thumbnail)
+        return sum(a.nbytes for a in arrays if a is not None) + self.overlay.nbytes + self.tracker.nbytes
     
     def get_instrument_display_name(self):
         """Get display name for the instrument"""
@@ -193,112 +170,37 @@ class SquareDetector:
         return display_names.get(self.instrument_type, f"🎵 {self.instrument_type.title()}")
     
     
-    def detect_duplicate_notes(self):
-        """Check for duplicate note assignments and return True if found"""
-        assignments = list(self.square_note_assignments.values())
-        unique_assignments = set(assignments)
-        
-        if len(assignments) != len(unique_assignments):
-            print(f"🚨 DUPLICATE NOTES DETECTED: {assignments}")
-            return True
-        return False
-    
-    def force_scale_based_assignment(self, stable_squares):
-        """Force assignment based on current scale - squares always get sequential scale notes"""
-        print(f"🎼 SCALE ASSIGNMENT: Assigning notes from {self.available_notes} scale...")
-        
-        # Clear all current assignments
-        self.square_note_assignments.clear()
-        
-        # Sort squares by position for consistent assignment (left-to-right, top-to-bottom)
-        sorted_squares = sorted(stable_squares, key=lambda sq: (sq['center'][1] // 100, sq['center'][0]))
-        
-        # Assign notes in scale sequence
-        for i, square in enumerate(sorted_squares):
-            square_id = square['id']
-            note_index = i % len(self.available_notes)
-            assigned_note = self.available_notes[note_index]
-            self.square_note_assignments[square_id] = assigned_note
-            print(f"🎼 SCALE: Square {i+1} → {assigned_note} (position {square['center']})")
-        
-        print(f"✅ SCALE ASSIGNMENT COMPLETE: {len(stable_squares)} squares mapped to scale")
+    def assign_notes_to_squares(self, promoted, removed):
+        """Update the note layout for squares that became stable or were dropped this frame"""
+        if not promoted and not removed:
+            return False
         
-        # Show the final mapping
-        final_notes = [self.square_note_assignments[sq['id']] for sq in sorted_squares]
-        print(f"🎵 Final scale mapping: {' → '.join(final_notes)}")
-    
-    def assign_notes_to_squares(self, stable_squares):
-        """Assign notes to squares - always uses current scale sequence"""
-        if not stable_squares:
-            return
-        
-        # Sort squares by position (left-to-right, then top-to-bottom)
-        sorted_squares = sorted(stable_squares, key=lambda sq: (sq['center'][1] // 100, sq['center'][0]))
-        
-        # Check if we have the right number of assignments
-        current_assignments = len(self.square_note_assignments)
-        stable_count = len(stable_squares)
-        
-        # If number of squares changed or we have duplicates, reassign everything
-        if current_assignments != stable_count or self.detect_duplicate_notes():
-            print(f"🔄 REASSIGNMENT NEEDED: {current_assignments} assignments vs {stable_count} squares")
-            self.force_scale_based_assignment(stable_squares)
-            return
-        
-        # Check if any square doesn't have an assignment
-        missing_assignments = []
-        for square in sorted_squares:
-            if square['id'] not in self.square_note_assignments:
-                missing_assignments.append(square)
-        
-        if missing_assignments:
-            print(f"🔄 MISSING ASSIGNMENTS: {len(missing_assignments)} squares need notes")
-            self.force_scale_based_assignment(stable_squares)
-            return
-        
-        # Clean up assignments for squares that no longer exist
-        existing_square_ids = [sq['id'] for sq in stable_squares]
-        assignments_to_remove = []
-        for square_id in self.square_note_assignments:
-            if square_id not in existing_square_ids:
-                assignments_to_remove.append(square_id)
-        
-        if assignments_to_remove:
-            print(f"🗑️ CLEANING UP: {len(assignments_to_remove)} old assignments")
-            for square_id in assignments_to_remove:
-                del self.square_note_assignments[square_id]
-            # After cleanup, reassign to ensure proper scale sequence
-            self.force_scale_based_assignment(stable_squares)
-            return
-        
-        # If we get here, everything is properly assigned
-        assignments = [self.square_note_assignments.get(sq['id'], 'None') for sq in sorted_squares]
-        print(f"🎵 Current scale assignments: {' | '.join([f'{i+1}:{note}' for i, note in enumerate(assignments)])}")
+        layout = self.note_layout
+        changed = False
+        for square_id in removed:
+            changed = layout.remove(square_id) or changed
+        for square in promoted:
+            changed = layout.add(square['id'], square['center']) or changed
+        if not changed:
+            return False  # Only tentative tracks came and went
+        
+        self.stats.count('scale_assignments')
+        if self.stats.sampled(logger):
+            logger.debug("Scale mapping for %d squares: %s", len(layout),
+                         ' → '.join(layout.note_for(square_id) for square_id in layout.ordered_ids()))
+        return True
 
     def get_note_for_square(self, square_id):
         """Get the assigned note for a specific square"""
-        return self.square_note_assignments.get(square_id, 'C')  # Default to C if not assigned
+        return self.note_layout.note_for(square_id, 'C')  # Default to C if not assigned
 
     def configure_note_sequence(self, notes):
         """Configure which notes to use and in what order"""
         self.available_notes = notes
-        print(f"🎼 Note sequence configured: {' → '.join(notes)}")
-        
-        # Get current stable squares
-        stable_squares = []
-        for square_id, square_info in self.registered_square_positions.items():
-            if square_info['stable']:
-                stabilized_square = square_info['square_data'].copy()
-                stabilized_square['center'] = square_info['averaged_center']
-                stabilized_square['bbox'] = square_info['averaged_bbox']
-                stable_squares.append(stabilized_square)
-        
-        # Force reassignment with new scale
-        if stable_squares:
-            print(f"🔄 SCALE CHANGE: Reassigning {len(stable_squares)} squares to new scale")
-            self.force_scale_based_assignment(stable_squares)
-        else:
-            print("🔄 SCALE CHANGE: No squares to reassign yet")
+        logger.info("Note sequence configured for %s: %s", self.instrument_type, ' → '.join(notes))
+        
+        # Reassign the current layout with the new scale
+        self.note_layout.set_notes(notes)
 
     def set_custom_scale(self, scale_name):
         """Set predefined musical scales"""
@@ -310,224 +212,325 @@ class SquareDetector:
             'fourths': ['C', 'F', 'G', 'D'],
             'simple': ['C', 'E', 'G', 'C'],  # Just C major chord
             'chord': ['C', 'E', 'G', 'B'],   # C major 7th chord
-            'octave': ['C', 'C', 'C', 'C']   # All same note (for rhythm)
+            'octave': ['C4', 'C5', 'C6', 'C5'],  # Same note across octaves
+            'major_two_octaves': ['C4', 'D4', 'E4', 'F4', 'G4', 'A4', 'B4',
+                                  'C5', 'D5', 'E5', 'F5', 'G5', 'A5', 'B5', 'C6'],
         }
         
         if scale_name in scales:
             self.configure_note_sequence(scales[scale_name])
             return True
         else:
-            print(f"❌ Scale '{scale_name}' not found. Available: {list(scales.keys())}")
+            logger.warning("Scale '%s' not found. Available: %s", scale_name, list(scales.keys()))
             return False
     
-    def detect_small_squares_only(self, frame):
-        """Detect only small drawn squares, ignore large hand shapes"""
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
+    def threshold_squares(self, gray):
+        """Blur, threshold and close a grayscale image so drawn outlines become solid contours"""
         # Light blur
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        
+        return self.threshold_blurred(cv2.GaussianBlur(gray, (5, 5), 0))
+    
+    def threshold_blurred(self, blurred):
+        """Threshold and close an already blurred grayscale image"""
         # Simple threshold
         _, thresh = cv2.threshold(blurred, 110, 255, cv2.THRESH_BINARY_INV)
         
         # Light morphological operations
-        kernel = np.ones((3,3), np.uint8)
-        thresh = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+        return cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, CLOSE_KERNEL)
+    
+    def detection_geometry(self, frame):
+        """Geometry for this frame size (cached until the camera resolution changes)"""
+        height, width = frame.shape[:2]
+        if self.geometry is None or self.geometry_size != (width, height):
+            self.geometry = DetectionGeometry(width, height, self.detection_width)
+            self.geometry_size = (width, height)
+        return self.geometry
+    
+    def evaluate_contour(self, contour, geometry, offset=(0, 0), index=0, verbose=False):
+        """Apply the small-square gates to one detection-resolution contour.
+        
+        ``offset`` is the position of the contour's image within the detection
+        frame. Returns square data in full-resolution coordinates, or None.
+        """
+        area = cv2.contourArea(contour)
+        
+        # KEY: Very strict size limits to exclude hands
+        if not (geometry.min_area <= area <= geometry.max_area):  # Small squares only!
+            self.stats.reject('area')
+            if verbose:
+                logger.debug("Contour %d: rejected - area %.0f outside [%.0f-%.0f]",
+                             index, area, geometry.min_area, geometry.max_area)
+            return None
+            
+        x, y, w, h = cv2.boundingRect(contour)
+        x += offset[0]
+        y += offset[1]
+        
+        # Skip edges
+        margin = geometry.margin
+        if x < margin or y < margin or x + w > geometry.width - margin or y + h > geometry.height - margin:
+            self.stats.reject('edge')
+            if verbose:
+                logger.debug("Contour %d: rejected - too close to edges", index)
+            return None
+        
+        # KEY: Strict size limits for width/height
+        if not (geometry.min_side <= w <= geometry.max_side and geometry.min_side <= h <= geometry.max_side):
+            self.stats.reject('size')
+            if verbose:
+                logger.debug("Contour %d: rejected - size %dx%d outside [%.0f-%.0f]",
+                             index, w, h, geometry.min_side, geometry.max_side)
+            return None
+        
+        # Reasonable aspect ratio
+        aspect_ratio = float(w) / h
+        if not (0.7 <= aspect_ratio <= 1.4):
+            self.stats.reject('aspect_ratio')
+            if verbose:
+                logger.debug("Contour %d: rejected - aspect ratio %.2f", index, aspect_ratio)
+            return None
+        
+        # Check if it has reasonable corners
+        perimeter = cv2.arcLength(contour, True)
+        epsilon = 0.04 * perimeter
+        approx = cv2.approxPolyDP(contour, epsilon, True)
+        
+        if not (4 <= len(approx) <= 6):
+            self.stats.reject('corners')
+            if verbose:
+                logger.debug("Contour %d: rejected - %d corners", index, len(approx))
+            return None
+        
+        # If we get here, it's a small square-like shape; map it to full resolution
+        if verbose:
+            logger.debug("Contour %d: accepted - area=%.0f, size=%dx%d, AR=%.2f", index, area, w, h, aspect_ratio)
+        inv = 1.0 / geometry.scale
+        if offset != (0, 0) or inv != 1.0:
+            contour = np.round((contour + np.array(offset)) * inv).astype(np.int32)
+            x, y, w, h = int(round(x * inv)), int(round(y * inv)), int(round(w * inv)), int(round(h * inv))
+            area *= inv * inv
+        return {
+            'id': None,  # Assigned by the tracker
+            'center': (x + w//2, y + h//2),
+            'bbox': (x, y, w, h),
+            'area': area,
+            'contour': contour,
+            'aspect_ratio': aspect_ratio
+        }
+    
+    def refine_square(self, ctx, square, geometry):
+        """Re-fit a square found at detection resolution using the full-resolution pixels in its bbox"""
+        x, y, w, h = square['bbox']
+        pad = int(np.ceil(2 / geometry.scale)) + 2
+        frame_height, frame_width = ctx.shape[:2]
+        x0, y0 = max(x - pad, 0), max(y - pad, 0)
+        x1, y1 = min(x + w + pad, frame_width), min(y + h + pad, frame_height)
+        
+        roi_thresh = self.threshold_squares(ctx.gray[y0:y1, x0:x1])
+        contours, _ = cv2.findContours(roi_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return square
+        
+        contour = max(contours, key=cv2.contourArea) + np.array((x0, y0), dtype=np.int32)
+        rx, ry, rw, rh = cv2.boundingRect(contour)
+        # Only accept refinements that agree with the coarse fit
+        if abs(rw - w) > pad * 2 or abs(rh - h) > pad * 2:
+            return square
+        
+        square.update(
+            center=(rx + rw//2, ry + rh//2),
+            bbox=(rx, ry, rw, rh),
+            area=cv2.contourArea(contour),
+            contour=contour,
+            aspect_ratio=float(rw) / rh,
+        )
+        return square
+    
+    def finish_detection(self, ctx, squares, geometry):
+        """Optional full-resolution refinement of squares detected on a downscaled frame"""
+        if self.refine and geometry.scale < 1.0:
+            squares = [self.refine_square(ctx, square, geometry) for square in squares]
+        self.stats.count('squares_accepted', len(squares))
+        return squares
+    
+    def detect_squares(self, frame):
+        """Full-frame scan or incremental ROI re-validation, whichever is due"""
+        ctx = FrameContext.of(frame)
+        # Tentative tracks too: a square first seen on a full scan needs its second hit from an ROI frame
+        known_squares = [track.bbox for track in self.tracker.active_squares()]
+        
+        if (not self.incremental or not known_squares
+                or self.frames_since_full_scan >= self.full_scan_interval
+                or self.scene_changed(ctx)):
+            self.frames_since_full_scan = 0
+            self.scene_thumbnail = self.make_thumbnail(ctx)
+            self.stats.count('full_scans')
+            return self.detect_small_squares_only(ctx)
+        
+        self.frames_since_full_scan += 1
+        self.stats.count('roi_scans')
+        return self.redetect_known_squares(ctx, known_squares)
+    
+    def make_thumbnail(self, frame):
+        return cv2.resize(FrameContext.of(frame).gray, (32, 24), interpolation=cv2.INTER_AREA)
+    
+    def scene_changed(self, frame):
+        """Global-change detector: most of a coarse thumbnail differs from the last full scan"""
+        if self.scene_thumbnail is None:
+            return True
+        diff = cv2.absdiff(self.make_thumbnail(frame), self.scene_thumbnail)
+        # A hand covers part of the board; a moved camera or sheet changes most of it
+        return np.count_nonzero(diff > 40) > diff.size * 0.5
+    
+    def redetect_known_squares(self, frame, known_bboxes):
+        """Re-validate known squares inside small padded ROIs instead of scanning the whole frame"""
+        ctx = FrameContext.of(frame)
+        geometry = self.detection_geometry(ctx)
+        scale = geometry.scale
+        frame_height, frame_width = ctx.shape[:2]
+        thresh = np.zeros((geometry.height, geometry.width), dtype=np.uint8)
+        verbose = self.stats.sampled(logger)
+        squares = []
+        pad = self.roi_padding
+        
+        for x, y, w, h in known_bboxes:
+            # ROI in detection coordinates, cut from the full-resolution frame
+            dx0, dy0 = int(max(x - pad, 0) * scale), int(max(y - pad, 0) * scale)
+            dx1 = min(int(np.ceil(min(x + w + pad, frame_width) * scale)), geometry.width)
+            dy1 = min(int(np.ceil(min(y + h + pad, frame_height) * scale)), geometry.height)
+            if dx1 <= dx0 or dy1 <= dy0:
+                continue
+            gray = ctx.gray[int(dy0 / scale):int(np.ceil(dy1 / scale)), int(dx0 / scale):int(np.ceil(dx1 / scale))]
+            if scale < 1.0:
+                gray = cv2.resize(gray, (dx1 - dx0, dy1 - dy0), interpolation=cv2.INTER_AREA)
+            roi_thresh = self.threshold_squares(gray)
+            thresh[dy0:dy1, dx0:dx1] = roi_thresh
+            
+            contours, _ = cv2.findContours(roi_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            self.stats.count('contours_seen', len(contours))
+            
+            # Keep the accepted contour closest to where the square was
+            best, best_distance = None, None
+            for i, contour in enumerate(contours):
+                square = self.evaluate_contour(contour, geometry, (dx0, dy0), i, verbose)
+                if square is None:
+                    continue
+                cx, cy = square['center']
+                distance = (cx - (x + w // 2)) ** 2 + (cy - (y + h // 2)) ** 2
+                if best is None or distance < best_distance:
+                    best, best_distance = square, distance
+            if best is not None:
+                squares.append(best)
+        
+        return self.finish_detection(ctx, squares, geometry), thresh
+    
+    def detect_small_squares_only(self, frame):
+        """Detect only small drawn squares, ignore large hand shapes"""
+        ctx = FrameContext.of(frame)
+        geometry = self.detection_geometry(ctx)
+        thresh = self.threshold_blurred(ctx.detection_blurred(geometry.width, geometry.height))
         
         # Find contours
         contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        valid_squares = []
-        frame_height, frame_width = frame.shape[:2]
-        
-        print(f"Simple detection: Processing {len(contours)} contours")
+        verbose = self.stats.sampled(logger)
+        self.stats.count('contours_seen', len(contours))
         
+        valid_squares = []
         for i, contour in enumerate(contours):
-            area = cv2.contourArea(contour)
-            
-            # KEY: Very strict size limits to exclude hands
-            if not (1500 <= area <= 8000):  # Small squares only!
-                print(f"  Contour {i}: REJECTED - area {area:.0f} outside [1500-8000] (hands are bigger)")
-                continue
-                
-            x, y, w, h = cv2.boundingRect(contour)
-            
-            # Skip edges
-            if x < 40 or y < 40 or x + w > frame_width - 40 or y + h > frame_height - 40:
-                print(f"  Contour {i}: REJECTED - too close to edges")
-                continue
-            
-            # KEY: Strict size limits for width/height
-            if not (30 <= w <= 120 and 30 <= h <= 120):  # Small squares only!
-                print(f"  Contour {i}: REJECTED - size {w}x{h} outside [30-120] (hands are bigger)")
-                continue
-            
-            # Reasonable aspect ratio
-            aspect_ratio = float(w) / h
-            if not (0.7 <= aspect_ratio <= 1.4):
-                print(f"  Contour {i}: REJECTED - aspect ratio {aspect_ratio:.2f}")
-                continue
-            
-            # Check if it has reasonable corners
-            perimeter = cv2.arcLength(contour, True)
-            epsilon = 0.04 * perimeter
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-            
-            if not (4 <= len(approx) <= 6):
-                print(f"  Contour {i}: REJECTED - {len(approx)} corners")
-                continue
-            
-            # If we get here, it's a small square-like shape
-            square_id = f"small_square_{x//50}_{y//50}"
-            square_data = {
-                'id': square_id,
-                'center': (x + w//2, y + h//2),
-                'bbox': (x, y, w, h),
-                'area': area,
-                'contour': contour,
-                'aspect_ratio': aspect_ratio
-            }
-            valid_squares.append(square_data)
-            print(f"  ✓ Contour {i}: ACCEPTED - area={area:.0f}, size={w}x{h}, AR={aspect_ratio:.2f}")
-        
-        print(f"Small square detection found {len(valid_squares)} squares\n")
-        return valid_squares, thresh
+            square = self.evaluate_contour(contour, geometry, index=i, verbose=verbose)
+            if square is not None:
+                valid_squares.append(square)
+        
+        return self.finish_detection(ctx, valid_squares, geometry), thresh
     
     def register_stable_squares(self, detected_squares):
         """Register squares that appear consistently"""
-        current_square_ids = [sq['id'] for sq in detected_squares]
+        stable_squares = self.tracker.update(detected_squares, self.frame_count)
         
-        for square in detected_squares:
-            square_id = square['id']
-            current_center = square['center']
-            current_bbox = square['bbox']
-            
-            if square_id not in self.registered_square_positions:
-                self.registered_square_positions[square_id] = {
-                    'square_data': square,
-                    'seen_count': 1,
-                    'stable': False,
-                    'first_seen_frame': self.frame_count,
-                    'position_history': [current_center],
-                    'averaged_center': current_center,
-                    'averaged_bbox': current_bbox
-                }
-            else:
-                square_info = self.registered_square_positions[square_id]
-                square_info['seen_count'] += 1
-                square_info['square_data'] = square
-                
-                square_info['position_history'].append(current_center)
-                if len(square_info['position_history']) > 5:
-                    square_info['position_history'].pop(0)
-                
-                # Average position for stability
-                positions = square_info['position_history']
-                avg_x = int(np.mean([pos[0] for pos in positions]))
-                avg_y = int(np.mean([pos[1] for pos in positions]))
-                square_info['averaged_center'] = (avg_x, avg_y)
-                square_info['averaged_bbox'] = current_bbox
-                
-                # Mark as stable quickly
-                if square_info['seen_count'] >= 2:  # Very fast registration
-                    square_info['stable'] = True
-        
-        # Clean up old squares
-        squares_to_remove = []
-        for square_id in self.registered_square_positions:
-            if square_id not in current_square_ids:
-                self.registered_square_positions[square_id]['seen_count'] -= 2
-                if self.registered_square_positions[square_id]['seen_count'] <= -2:
-                    squares_to_remove.append(square_id)
-        
-        for square_id in squares_to_remove:
-            del self.registered_square_positions[square_id]
-            if square_id in self.finger_in_square:
-                del self.finger_in_square[square_id]
-        
-        # Return stable squares
-        stable_squares = []
-        for square_id, square_info in self.registered_square_positions.items():
-            if square_info['stable']:
-                stabilized_square = square_info['square_data'].copy()
-                stabilized_square['center'] = square_info['averaged_center']
-                stabilized_square['bbox'] = square_info['averaged_bbox']
-                stable_squares.append(stabilized_square)
+        # Clean up squares whose tracks were dropped
+        for square_id in self.tracker.removed:
+            self.finger_in_square.pop(square_id, None)
+            self.square_motion.pop(square_id, None)
+            self.square_verdicts.pop(square_id, None)
         
         return stable_squares
     
+    def verify_squares(self, frame, detected_squares, stable_squares):
+        """Classify this frame's not-yet-verified tracks in one batch; drop rejected ones from the stable set"""
+        pending = [square for square in detected_squares if square['id'] not in self.square_verdicts]
+        if pending:
+            verdicts = self.verifier.verify(FrameContext.of(frame).gray, [square['bbox'] for square in pending])
+            for square, accepted in zip(pending, verdicts):
+                self.square_verdicts[square['id']] = accepted
+                if not accepted:
+                    self.stats.reject('verifier')
+            self.stats.count('verifier_batches')
+        return [square for square in stable_squares if self.square_verdicts.get(square['id'], True)]
+    
     def detect_finger_touches(self, frame, stable_squares):
         """Detect finger touches on stable squares"""
-        if not hasattr(self, 'background_frame'):
-            self.background_frame = frame.copy()
+        gray = FrameContext.of(frame).gray
+        if self.background is None or self.background.shape != gray.shape:
+            # Single-channel float running average of the grayscale frames
+            self.background = gray.astype(np.float32)
             return []
         
         # Update background slowly
         alpha = 0.1  # Faster adaptation
-        self.background_frame = cv2.addWeighted(frame, alpha, self.background_frame, 1 - alpha, 0)
+        cv2.accumulateWeighted(gray, self.background, alpha)
         
         # Calculate motion
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        bg_gray = cv2.cvtColor(self.background_frame, cv2.COLOR_BGR2GRAY)
-        
-        diff = cv2.absdiff(gray, bg_gray)
-        _, motion_mask = cv2.threshold(diff, 20, 255, cv2.THRESH_BINARY)  # Lower threshold
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, motion_mask = cv2.threshold(diff, 20, 1, cv2.THRESH_BINARY)  # Lower threshold
         
         # Dilate motion
-        kernel = np.ones((7,7), np.uint8)
-        motion_mask = cv2.dilate(motion_mask, kernel, iterations=2)
+        motion_mask = cv2.dilate(motion_mask, MOTION_KERNEL, iterations=2)
         
         finger_touches = []
+        if not stable_squares:
+            return finger_touches
         
-        for square in stable_squares:
+        # One summed-area table per frame; every square's motion coverage is
+        # then four lookups, however many squares there are
+        coverage = region_fractions(cv2.integral(motion_mask), [square['bbox'] for square in stable_squares])
+        
+        for square, motion_percentage in zip(stable_squares, coverage.tolist()):
             square_id = square['id']
-            x, y, w, h = square['bbox']
             
             # Check motion in square area
-            if y + h <= motion_mask.shape[0] and x + w <= motion_mask.shape[1]:
-                square_motion = motion_mask[y:y+h, x:x+w]
-                motion_pixels = np.sum(square_motion > 0)
-                motion_percentage = motion_pixels / (w * h) if (w * h) > 0 else 0
-                
+            if not np.isnan(motion_percentage):  # NaN: bbox outside the frame
                 is_touched = motion_percentage > 0.2  # Lower threshold for easier triggering
                 was_touched = square_id in self.finger_in_square
+                previous_motion = self.square_motion.get(square_id, 0.0)
+                self.square_motion[square_id] = motion_percentage
                 
                 if is_touched and not was_touched:
                     self.finger_in_square[square_id] = time.time()
                     finger_touches.append({
                         'type': 'touch_start',
                         'square_id': square_id,
-                        'square': square
+                        'square': square,
+                        'velocity': self.compute_velocity(motion_percentage, motion_percentage - previous_motion)
                     })
                 elif not is_touched and was_touched:
                     del self.finger_in_square[square_id]
         
         return finger_touches
     
+    def compute_velocity(self, motion_percentage, onset):
+        """Map touch intensity (motion coverage) and onset speed (coverage jump since last frame) to a 0.3-1.0 gain"""
+        intensity = min(max((motion_percentage - 0.2) / 0.8, 0.0), 1.0)
+        speed = min(max(onset / 0.5, 0.0), 1.0)
+        return round(float(0.3 + 0.7 * (0.6 * intensity + 0.4 * speed)), 3)
+    
     def play_piano_note(self, square_id):
         """Play the specifically assigned note for this square"""
-        current_time = time.time()
-        
-        if square_id in self.sound_cooldown:
-            if current_time - self.sound_cooldown[square_id] < 0.4:
-                return
-        
-        # Get the assigned note for this square
-        note = self.get_note_for_square(square_id)
-        
-        # Play the assigned note
-        if note in self.piano_notes:
-            self.piano_notes[note].play()
-            self.sound_cooldown[square_id] = current_time
-            
-            print(f"🎵 Playing assigned note {note} for square {square_id}")
-        else:
-            print(f"⚠️ Note {note} not found in piano_notes")
+        self.play_instrument_note(square_id)
 
 
-    def play_instrument_note(self, square_id):
-        """Play the specifically assigned note for this square using current instrument"""
-        current_time = time.time()
+    def play_instrument_note(self, square_id, timestamp=None, velocity=1.0):
+        """Play the specifically assigned note for this square using current instrument, timed by the frame's capture time"""
+        current_time = timestamp if timestamp is not None else time.time()
         
         if square_id in self.sound_cooldown:
             if current_time - self.sound_cooldown[square_id] < 0.4:
@@ -536,75 +539,146 @@ class SquareDetector:
         # Get the assigned note for this square
         note = self.get_note_for_square(square_id)
         
-        # Play the assigned note with current instrument
+        # Play the assigned note with current instrument ('C', 'C5', 'F#4', ...)
+        note = synthesis.resolve_note(self.instrument_sounds, note) or note
         if note in self.instrument_sounds:
-            self.instrument_sounds[note].play()
+            if self.event_channel is not None:
+                self.event_channel({
+                    'type': 'note',
+                    'square_id': square_id,
+                    'note': note,
+                    'instrument': self.instrument_type,
+                    'velocity': velocity,
+                    'captured_at': current_time,
+                })
+            # Velocity is applied as gain at mix time; every velocity shares one sample
+            self.audio_sink.play(note, self.instrument_sounds[note], gain=velocity, timestamp=current_time)
             self.sound_cooldown[square_id] = current_time
             
-            instrument_name = self.get_instrument_display_name()
-            print(f"🎵 Playing {instrument_name} note {note} for square {square_id}")
+            self.stats.count('notes_played')
+            logger.debug("Playing %s note %s for square %s (velocity %.2f)", self.instrument_type, note, square_id, velocity)
         else:
-            print(f"⚠️ Note {note} not found in {self.instrument_type} sounds")
+            logger.warning("Note %s not found in %s sounds", note, self.instrument_type)
     
-    def process_frame(self, frame):
+    def process_frame(self, frame, timestamp=None):
         """Main processing function - same logic, different sounds"""
+        analysis = self.analyze_frame(frame, timestamp)
+        if analysis.warming_up:
+            return frame, [], [], np.zeros((frame.shape[0], frame.shape[1]), dtype=np.uint8)
+        return self.render_frame(analysis), analysis.detected_squares, analysis.touches, analysis.thresh
+    
+    def analyze_frame(self, frame, timestamp=None):
+        """Detect, track, assign and play; everything but drawing.
+        
+        Returns a FrameAnalysis with snapshots of the squares, so render_frame
+        can run on another thread while the next frame is analyzed.
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
         self.frame_count += 1
         
         if self.frame_count < 3:
-            return frame, [], [], np.zeros((frame.shape[0], frame.shape[1]), dtype=np.uint8)
+            return FrameAnalysis(frame, timestamp)
         
-        # All the existing square detection logic remains the same
-        detected_squares, thresh = self.detect_small_squares_only(frame)
-        stable_squares = self.register_stable_squares(detected_squares)
-        self.assign_notes_to_squares(stable_squares)
+        stats = self.stats
         
-        # Safety check every 20 frames
-        if self.frame_count % 20 == 0 and stable_squares:
-            if self.detect_duplicate_notes():
-                self.force_scale_based_assignment(stable_squares)
+        # Gray/blurred planes are computed once here and shared by every stage
+        ctx = FrameContext(frame, timestamp)
         
-        # Detect finger touches
-        finger_touches = self.detect_finger_touches(frame, stable_squares)
+        with stats.stage('detect'):
+            detected_squares, thresh = self.detect_squares(ctx)
         
-        # Play sounds with current instrument
-        for touch in finger_touches:
-            if touch['type'] == 'touch_start':
-                self.play_instrument_note(touch['square_id'])  # Changed method name
+        with stats.stage('register'):
+            stable_squares = self.register_stable_squares(detected_squares)
         
-        # Enhanced visualization with instrument info
-        result_frame = frame.copy()
+        promoted = self.tracker.promoted
+        if self.verifier is not None:
+            with stats.stage('verify'):
+                stable_squares = self.verify_squares(ctx, detected_squares, stable_squares)
+                promoted = [square for square in promoted if self.square_verdicts.get(square['id'], True)]
+        
+        with stats.stage('assign'):
+            self.assign_notes_to_squares(promoted, self.tracker.removed)
         
-        # Draw detected squares (yellow)
+        with stats.stage('touch'):
+            finger_touches = self.detect_finger_touches(ctx, stable_squares)
+            
+            # Play sounds with current instrument
+            for touch in finger_touches:
+                if touch['type'] == 'touch_start':
+                    self.play_instrument_note(touch['square_id'], timestamp, touch['velocity'])
+        
+        stats.frame_done()
+        stable_squares = [square.copy() for square in stable_squares]
+        return FrameAnalysis(
+            frame, timestamp, detected_squares, stable_squares, finger_touches, thresh,
+            notes={square['id']: self.get_note_for_square(square['id']) for square in stable_squares},
+            touched=frozenset(square['id'] for square in stable_squares if square['id'] in self.finger_in_square),
+            scale=tuple(self.available_notes),
+        )
+    
+    def render_frame(self, analysis):
+        """Draw the overlay for an analyzed frame, timed as the 'draw' stage"""
+        with self.stats.stage('draw'):
+            return self.draw_overlay(analysis.frame, analysis.detected_squares, analysis.stable_squares,
+                                     analysis.notes, analysis.touched, analysis.scale)
+    
+    def draw_overlay(self, frame, detected_squares, stable_squares, notes=None, touched=None, scale=None):
+        """Enhanced visualization with instrument info"""
+        result_frame = frame.copy()
+        if notes is None:
+            notes = {square['id']: self.get_note_for_square(square['id']) for square in stable_squares}
+        if touched is None:
+            touched = self.finger_in_square
+        scale = tuple(scale if scale is not None else self.available_notes)
+        
+        # Stable squares, their notes and the header come from the cached layer; it is
+        # redrawn when the layout changes or a box moves beyond jitter, not on every pixel
+        key = (frame.shape, self.instrument_type, scale,
+               tuple((square['id'], notes.get(square['id'], 'C')) for square in stable_squares))
+        boxes = [square['bbox'] for square in stable_squares]
+        if not self.overlay.is_current(key, boxes, self.overlay_tolerance):
+            self.draw_static_overlay(key, frame.shape, stable_squares, notes, scale)
+        self.overlay.composite(result_frame)
+        
+        # Draw detected squares (yellow); only not-yet-stable ones get a label
         for square in detected_squares:
             cv2.drawContours(result_frame, [square['contour']], -1, (0, 255, 255), 2)
-            x, y = square['center']
-            cv2.putText(result_frame, "DETECTED", (x-30, y-15), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 255), 1)
+            if square['id'] not in notes:
+                x, y = square['center']
+                cv2.putText(result_frame, "DETECTED", (x-30, y-15), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 255), 1)
         
-        # Draw stable squares with instrument-specific info
+        # Touched squares are the only per-frame highlights
         for square in stable_squares:
-            x, y, w, h = square['bbox']
-            cv2.rectangle(result_frame, (x, y), (x + w, y + h), (0, 255, 0), 4)
-            
-            assigned_note = self.get_note_for_square(square['id'])
-            cv2.putText(result_frame, f"NOTE: {assigned_note}", (x, y-30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            
-            square_info = self.registered_square_positions[square['id']]
-            seen_count = square_info['seen_count']
-            cv2.putText(result_frame, f"READY:{seen_count}", (x, y-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 255, 0), 1)
-            
-            if square['id'] in self.finger_in_square:
+            if square['id'] in touched:
+                x, y, w, h = square['bbox']
                 cv2.rectangle(result_frame, (x-5, y-5), (x + w + 5, y + h + 5), (0, 0, 255), 4)
-                cv2.putText(result_frame, f"PLAYING {assigned_note}!", (x-15, y + h + 25), 
+                cv2.putText(result_frame, f"PLAYING {notes.get(square['id'], 'C')}!", (x-15, y + h + 25), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+        return result_frame
+    
+    def draw_static_overlay(self, key, shape, stable_squares, notes, scale):
+        """Re-render the cached layer: stable squares with their notes, and the header"""
+        layer = self.overlay
+        layer.begin(key, shape, [square['bbox'] for square in stable_squares])
+        
+        for square in stable_squares:
+            x, y, w, h = square['bbox']
+            layer.rectangle((x, y), (x + w, y + h), (0, 255, 0), 4)
+            layer.text(f"NOTE: {notes.get(square['id'], 'C')}", (x, y-30), 0.6, (0, 255, 0), 2)
+            layer.text("READY", (x, y-10), 0.4, (0, 255, 0), 1)
         
         # Display instrument and scale info
         instrument_display = self.get_instrument_display_name()
-        cv2.putText(result_frame, f"Instrument: {instrument_display} | Squares: {len(stable_squares)} | Scale: {' '.join(self.available_notes)}", 
-                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        return result_frame, detected_squares, finger_touches, thresh
+        layer.text(f"Instrument: {instrument_display} | Squares: {len(stable_squares)} | Scale: {' '.join(scale)}", 
+                   (10, 30), 0.6, (255, 255, 255), 2)
+        self.stats.count('overlay_rebuilds')
+    
+    def encode_jpeg(self, image):
+        """JPEG-encode an output frame, timed as the 'encode' stage"""
+        with self.stats.stage('encode'):
+            _, buffer = cv2.imencode('.jpg', image)
+        return buffer.tobytes()
 
 
 # Test function for standalone testing
@@ -0,0 +1,121 @@
+"""
+Per-session note event channel.
+
+Detectors publish a small event for every triggered note (square id, note,
+instrument, velocity and the capture timestamp of the frame it was detected
+in). Clients subscribe per session, typically over Server-Sent Events, and
+play the notes locally in the browser. Event delivery is independent of the
+MJPEG video stream, so a note is never stuck behind a large JPEG frame.
+
+Each subscriber has its own bounded queue; a subscriber that falls behind
+loses its oldest events instead of slowing down the detector.
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+
+class Subscription:
+    """One subscriber's bounded queue of events"""
+
+    def __init__(self, bus, session_id, max_queue):
+        self.bus = bus
+        self.session_id = session_id
+        self.dropped = 0
+        self.delivered = 0
+        self.max_depth = 0
+        self._queue = deque(maxlen=max_queue)
+        self._ready = threading.Condition()
+        self._closed = False
+
+    def put(self, event):
+        with self._ready:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(event)
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within ``timeout`` seconds"""
+        with self._ready:
+            if not self._queue and not self._closed:
+                self._ready.wait(timeout)
+            if not self._queue:
+                return None
+            self.delivered += 1
+            return self._queue.popleft()
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def metrics(self):
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+        }
+
+    def close(self):
+        self.bus.unsubscribe(self)
+        with self._ready:
+            self._closed = True
+            self._ready.notify_all()
+
+
+class NoteEventBus:
+    """Fans note events out to the subscribers of each session"""
+
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id):
+        subscription = Subscription(self, session_id, self.max_queue)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.session_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.session_id]
+
+    def publish(self, session_id, event):
+        """Stamp ``event`` with an id and emit time and deliver it to the session's subscribers"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(session_id, ()))
+        if not subscribers:
+            return
+        event = dict(event, id=next(self._ids), emitted_at=time.time())
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscriber_count(self, session_id=None):
+        with self._lock:
+            if session_id is not None:
+                return len(self._subscribers.get(session_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+
+note_events = NoteEventBus()
+
+
+def format_sse(event):
+    """Encode an event as a Server-Sent Events message"""
+    data = json.dumps(event, separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n".encode('utf-8')
@@ -0,0 +1,122 @@
+"""
+Per-frame preprocessing shared between pipeline stages.
+
+``FrameContext`` wraps one camera frame and lazily computes the derived planes
+the stages need (grayscale, the downscaled detection plane and its blur), each
+at most once per frame, so square and touch detection share one conversion.
+
+``FrameAnalysis`` carries one frame's analysis results from the detect stage
+to the render stage.
+"""
+
+import cv2
+import numpy as np
+
+
+def decode_image(data):
+    """BGR frame from encoded JPEG/WebP/PNG bytes, or None if they cannot be decoded"""
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+
+class FrameContext:
+    """A camera frame plus its derived planes, computed on first use"""
+
+    __slots__ = ('frame', 'timestamp', '_gray', '_detection_gray', '_detection_blurred', '_detection_size')
+
+    def __init__(self, frame, timestamp=None):
+        self.frame = frame
+        self.timestamp = timestamp
+        self._gray = None
+        self._detection_gray = None
+        self._detection_blurred = None
+        self._detection_size = None
+
+    @classmethod
+    def of(cls, frame_or_context, timestamp=None):
+        """Accept either a raw BGR frame or an existing context"""
+        if isinstance(frame_or_context, cls):
+            return frame_or_context
+        return cls(frame_or_context, timestamp)
+
+    @property
+    def shape(self):
+        return self.frame.shape
+
+    @property
+    def gray(self):
+        """Full-resolution grayscale plane"""
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.frame, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    def detection_gray(self, width, height):
+        """Grayscale plane downscaled to the detection resolution"""
+        if self._detection_gray is None or self._detection_size != (width, height):
+            gray = self.gray
+            if (width, height) != (gray.shape[1], gray.shape[0]):
+                gray = cv2.resize(gray, (width, height), interpolation=cv2.INTER_AREA)
+            self._detection_gray = gray
+            self._detection_blurred = None
+            self._detection_size = (width, height)
+        return self._detection_gray
+
+    def detection_blurred(self, width, height):
+        """Light Gaussian blur of the detection plane"""
+        gray = self.detection_gray(width, height)
+        if self._detection_blurred is None:
+            self._detection_blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        return self._detection_blurred
+
+
+class FrameAnalysis:
+    """Result of the analysis half of the pipeline, detached from live detector state.
+
+    Holds everything the render stage needs (square snapshots, their notes,
+    the touched squares and the scale) so a frame can be drawn on another
+    thread while the detector already analyzes the next one.
+    """
+
+    __slots__ = ('frame', 'timestamp', 'detected_squares', 'stable_squares', 'touches', 'thresh',
+                 'notes', 'touched', 'scale')
+
+    def __init__(self, frame, timestamp, detected_squares=(), stable_squares=(), touches=(), thresh=None,
+                 notes=None, touched=frozenset(), scale=()):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.detected_squares = list(detected_squares)
+        self.stable_squares = list(stable_squares)
+        self.touches = list(touches)
+        self.thresh = thresh
+        self.notes = notes or {}
+        self.touched = touched
+        self.scale = scale
+
+    @property
+    def warming_up(self):
+        return self.thresh is None
+
+    def as_dict(self):
+        """JSON-friendly summary: stable squares with their notes, and this frame's touches"""
+        return {
+            'timestamp': self.timestamp,
+            'squares_detected': len(self.detected_squares),
+            'squares': [
+                {
+                    'id': square['id'],
+                    'center': square['center'],
+                    'bbox': square['bbox'],
+                    'area': square['area'],
+                    'note': self.notes.get(square['id']),
+                    'touched': square['id'] in self.touched,
+                }
+                for square in self.stable_squares
+            ],
+            'touches': [
+                {
+                    'square_id': touch['square_id'],
+                    'note': self.notes.get(touch['square_id']),
+                    'velocity': touch['velocity'],
+                }
+                for touch in self.touches
+            ],
+        }
@@ -0,0 +1,110 @@
+"""
+Per-stage timing and counters for the frame pipeline.
+
+Each detector owns a ``PipelineStats`` that records how long every stage of
+the pipeline took (detect, register, assign, touch, draw and, in the stream
+views, encode), plus counters such as contours seen and contours rejected by
+reason. ``snapshot()`` returns a JSON-friendly dict for the stats endpoint.
+
+Verbose per-contour diagnostics are only produced for sampled frames
+(every ``LEADZEPPELIN_DEBUG_SAMPLE_EVERY`` frames) and only when DEBUG
+logging is enabled for ``vision_api``.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger('vision_api')
+
+PIPELINE_STAGES = ('detect', 'register', 'assign', 'touch', 'draw', 'encode')
+
+
+class StageTiming:
+    """Running timing statistics for one stage"""
+
+    __slots__ = ('count', 'total', 'last', 'max', 'ewma')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self.ewma = 0.0
+
+    def add(self, seconds, smoothing=0.1):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+        self.ewma = seconds if self.count == 1 else self.ewma + smoothing * (seconds - self.ewma)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': (self.total / self.count * 1000) if self.count else 0.0,
+            'recent_ms': self.ewma * 1000,
+            'last_ms': self.last * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class PipelineStats:
+    """Stage timings, counters and rejection reasons for one detector"""
+
+    def __init__(self, debug_sample_every=None):
+        if debug_sample_every is None:
+            debug_sample_every = int(os.getenv('LEADZEPPELIN_DEBUG_SAMPLE_EVERY', '100'))
+        self.debug_sample_every = max(1, debug_sample_every)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.frames = 0
+            self.started_at = time.time()
+            self.stages = {name: StageTiming() for name in PIPELINE_STAGES}
+            self.counters = Counter()
+            self.rejections = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        with self._lock:
+            timing = self.stages.get(name)
+            if timing is None:
+                timing = self.stages[name] = StageTiming()
+            timing.add(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def reject(self, reason):
+        self.rejections[reason] += 1
+
+    def frame_done(self):
+        self.frames += 1
+
+    def sampled(self, log=logger):
+        """True if verbose diagnostics should be logged to ``log`` for the current frame"""
+        return self.frames % self.debug_sample_every == 0 and log.isEnabledFor(logging.DEBUG)
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-9)
+            return {
+                'frames': self.frames,
+                'fps': self.frames / elapsed,
+                'stages': {name: timing.as_dict() for name, timing in self.stages.items()},
+                'counters': dict(self.counters),
+                'rejections': dict(self.rejections),
+            }
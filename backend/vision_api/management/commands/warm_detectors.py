@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from vision_api.sample_cache import get_sample_bank
+from vision_api.synthesis import INSTRUMENTS
+from vision_api.verifier import square_verifier
+
+
+class Command(BaseCommand):
+    help = "Render and cache instrument sample banks so workers only have to map them on boot"
+
+    def add_arguments(self, parser):
+        parser.add_argument('instruments', nargs='*', default=list(INSTRUMENTS),
+                            help="Instruments to warm (default: all)")
+
+    def handle(self, *args, **options):
+        for instrument in options['instruments']:
+            bank = get_sample_bank(instrument)
+            self.stdout.write(self.style.SUCCESS(f"Warmed {instrument}: {len(bank)} notes"))
+        if square_verifier.enabled:
+            if square_verifier.warm_up():
+                self.stdout.write(self.style.SUCCESS(f"Loaded square verifier from {square_verifier.model_path}"))
+            else:
+                self.stdout.write(self.style.WARNING("Square verifier unavailable; candidates will not be verified"))
@@ -0,0 +1,231 @@
+"""
+Polyphonic software mixer for triggered notes.
+
+``VoiceMixer`` keeps its own list of active voices, sums them block by block
+in NumPy into a small ring buffer, and enforces a maximum polyphony with an
+explicit voice-stealing policy. The output device pulls blocks from the ring
+through ``read()`` (the audio callback); when the ring runs dry that is
+counted as an underrun.
+
+``MixerSink`` exposes the mixer as an ``AudioSink`` and drives a single
+pygame channel with the mixed blocks, so the number of squares that fire at
+once does not change latency. pygame has no pull callback, so ``MixerSink``
+is a Python thread that polls the channel every quarter block and hands it
+each block as a new ``Sound``, keeping at most one block queued. That thread
+competes for the GIL with the CV pipeline. When it is late the channel runs
+dry, and the gap is counted in ``underruns``, so latency and glitches under
+load come from ``stats()`` rather than from the block size alone. Stream APIs
+that pull from a real device callback (such as sounddevice) should call
+``VoiceMixer.callback`` instead.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+from .audio_output import AudioSink
+from .synthesis import SAMPLE_RATE
+
+STEAL_POLICIES = ('oldest', 'quietest', 'none')
+
+
+class Voice:
+    __slots__ = ('note', 'pcm', 'position', 'gain', 'started')
+
+    def __init__(self, note, pcm, gain, started):
+        self.note = note
+        self.pcm = pcm
+        self.position = 0
+        self.gain = gain
+        self.started = started
+
+    @property
+    def remaining(self):
+        return len(self.pcm) - self.position
+
+
+class RingBuffer:
+    """Fixed-capacity FIFO of int16 stereo frames"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros((capacity, 2), dtype=np.int16)
+        self._read = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def free(self):
+        return self.capacity - self._size
+
+    def write(self, block):
+        n = min(len(block), self.free)
+        start = (self._read + self._size) % self.capacity
+        first = min(n, self.capacity - start)
+        self._data[start:start + first] = block[:first]
+        self._data[:n - first] = block[first:n]
+        self._size += n
+        return n
+
+    def read(self, out):
+        n = min(len(out), self._size)
+        first = min(n, self.capacity - self._read)
+        out[:first] = self._data[self._read:self._read + first]
+        out[first:n] = self._data[:n - first]
+        self._read = (self._read + n) % self.capacity
+        self._size -= n
+        return n
+
+
+class VoiceMixer:
+    """Sums active voices into a ring buffer with bounded polyphony"""
+
+    def __init__(self, max_polyphony=16, steal_policy='oldest', block_frames=256,
+                 ring_blocks=4, master_gain=1.0, sample_rate=SAMPLE_RATE):
+        if steal_policy not in STEAL_POLICIES:
+            raise ValueError(f"Unknown steal policy '{steal_policy}'. Available: {list(STEAL_POLICIES)}")
+        self.max_polyphony = max_polyphony
+        self.steal_policy = steal_policy
+        self.block_frames = block_frames
+        self.master_gain = master_gain
+        self.sample_rate = sample_rate
+
+        self._voices = []
+        self._ring = RingBuffer(block_frames * ring_blocks)
+        self._accumulator = np.zeros((block_frames, 2), dtype=np.float32)
+        self._lock = threading.Lock()
+
+        self.voices_started = 0
+        self.voices_stolen = 0
+        self.voices_dropped = 0
+        self.blocks_mixed = 0
+        self.underruns = 0
+        self.mix_time_total = 0.0
+        self.mix_time_max = 0.0
+
+    def trigger(self, note, pcm, gain=1.0):
+        """Start a voice; returns False if it was dropped because polyphony is exhausted"""
+        with self._lock:
+            if len(self._voices) >= self.max_polyphony:
+                if self.steal_policy == 'none':
+                    self.voices_dropped += 1
+                    return False
+                self._voices.remove(self._steal_candidate())
+                self.voices_stolen += 1
+            self._voices.append(Voice(note, pcm, gain, time.perf_counter()))
+            self.voices_started += 1
+            return True
+
+    def _steal_candidate(self):
+        if self.steal_policy == 'quietest':
+            # Lowest gain first, then whichever has the least left to play
+            return min(self._voices, key=lambda v: (v.gain, v.remaining))
+        return min(self._voices, key=lambda v: v.started)
+
+    def mix_block(self):
+        """Mix one block of the active voices and return it as int16"""
+        started = time.perf_counter()
+        acc = self._accumulator
+        acc.fill(0)
+        with self._lock:
+            for voice in self._voices:
+                n = min(self.block_frames, voice.remaining)
+                acc[:n] += voice.pcm[voice.position:voice.position + n] * np.float32(voice.gain)
+                voice.position += n
+            self._voices = [v for v in self._voices if v.remaining > 0]
+
+        if self.master_gain != 1.0:
+            acc *= np.float32(self.master_gain)
+        block = np.clip(acc, -32768, 32767).astype(np.int16)
+
+        elapsed = time.perf_counter() - started
+        self.blocks_mixed += 1
+        self.mix_time_total += elapsed
+        self.mix_time_max = max(self.mix_time_max, elapsed)
+        return block
+
+    def pump(self):
+        """Top up the ring buffer with freshly mixed blocks"""
+        while self._ring.free >= self.block_frames:
+            self._ring.write(self.mix_block())
+
+    def read(self, frames):
+        """Audio callback: pull ``frames`` frames, zero-padding (and counting) underruns"""
+        out = np.zeros((frames, 2), dtype=np.int16)
+        if self._ring.read(out) < frames:
+            self.underruns += 1
+        return out
+
+    def callback(self, outdata, frames, time_info=None, status=None):
+        """Callback in the shape used by stream APIs such as sounddevice"""
+        self.pump()
+        outdata[:] = self.read(frames)
+
+    @property
+    def active_voices(self):
+        return len(self._voices)
+
+    def stats(self):
+        return {
+            'active_voices': self.active_voices,
+            'max_polyphony': self.max_polyphony,
+            'steal_policy': self.steal_policy,
+            'voices_started': self.voices_started,
+            'voices_stolen': self.voices_stolen,
+            'voices_dropped': self.voices_dropped,
+            'underruns': self.underruns,
+            'blocks_mixed': self.blocks_mixed,
+            'mix_time_avg_ms': (self.mix_time_total / self.blocks_mixed * 1000) if self.blocks_mixed else 0.0,
+            'mix_time_max_ms': self.mix_time_max * 1000,
+            'buffered_frames': len(self._ring),
+            'block_ms': self.block_frames / self.sample_rate * 1000,
+        }
+
+
+class MixerSink(AudioSink):
+    """AudioSink that mixes notes in software and streams the blocks to one pygame channel.
+
+    The output is fed by a polling thread, not a device callback; see the module docstring.
+    """
+
+    def __init__(self, mixer=None, sample_rate=SAMPLE_RATE):
+        import pygame
+
+        self._pygame = pygame
+        self.sample_rate = sample_rate
+        self.mixer = mixer or VoiceMixer(sample_rate=sample_rate)
+        pygame.mixer.init(frequency=sample_rate, size=-16, channels=2, buffer=self.mixer.block_frames)
+        self._channel = pygame.mixer.Channel(0)
+        self._running = True
+        self._thread = threading.Thread(target=self._stream, name="mixer-output", daemon=True)
+        self._thread.start()
+
+    def _next_sound(self):
+        self.mixer.pump()
+        return self._pygame.sndarray.make_sound(self.mixer.read(self.mixer.block_frames))
+
+    def _stream(self):
+        poll = self.mixer.block_frames / self.sample_rate / 4
+        while self._running:
+            if not self._channel.get_busy():
+                # The device drained everything we gave it
+                if self.mixer.blocks_mixed:
+                    self.mixer.underruns += 1
+                self._channel.play(self._next_sound())
+            elif self._channel.get_queue() is None:
+                self._channel.queue(self._next_sound())
+            time.sleep(poll)
+
+    def play(self, note, pcm, gain=1.0, timestamp=None):
+        self.mixer.trigger(note, pcm, gain)
+
+    def stats(self):
+        return self.mixer.stats()
+
+    def close(self):
+        self._running = False
+        self._thread.join(timeout=1)
+        self._pygame.mixer.quit()
@@ -0,0 +1,79 @@
+"""
+Square-to-note layout.
+
+Notes are assigned in reading order (rows of ``row_height`` pixels, then left
+to right) following the current scale. ``NoteLayout`` keeps that order as a
+sorted index maintained with ``bisect`` and a ``track id -> note`` dict, and
+only recomputes assignments when the layout actually changes: a track becomes
+stable, a track is dropped, or the scale is reconfigured. Looking up a
+square's note is a dict lookup, and frames where nothing changed do no
+assignment work at all.
+"""
+
+import bisect
+
+
+class NoteLayout:
+    """Reading-order index of squares and the note each one plays"""
+
+    def __init__(self, notes, row_height=100):
+        self.notes = list(notes)
+        self.row_height = row_height
+        self.assignments = {}
+        self.version = 0  # Bumped on every re-assignment
+        self._order = []  # Sorted (row, x, track_id)
+        self._keys = {}
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, track_id):
+        return track_id in self._keys
+
+    def order_key(self, track_id, center):
+        x, y = center
+        return (y // self.row_height, x, track_id)
+
+    def add(self, track_id, center):
+        """Insert a newly stable square; notes after it in reading order shift along the scale"""
+        if track_id in self._keys:
+            return False
+        key = self._keys[track_id] = self.order_key(track_id, center)
+        position = bisect.bisect_left(self._order, key)
+        self._order.insert(position, key)
+        self._assign_from(position)
+        return True
+
+    def remove(self, track_id):
+        """Drop a square from the layout; False if it was never in it (e.g. a tentative track)"""
+        key = self._keys.pop(track_id, None)
+        if key is None:
+            return False
+        position = bisect.bisect_left(self._order, key)
+        del self._order[position]
+        self.assignments.pop(track_id, None)
+        self._assign_from(position)
+        return True
+
+    def set_notes(self, notes):
+        self.notes = list(notes)
+        self._assign_from(0)
+
+    def clear(self):
+        self._order.clear()
+        self._keys.clear()
+        self.assignments.clear()
+        self.version += 1
+
+    def note_for(self, track_id, default='C'):
+        return self.assignments.get(track_id, default)
+
+    def ordered_ids(self):
+        return [key[2] for key in self._order]
+
+    def _assign_from(self, position):
+        """Re-assign notes from ``position`` on; earlier squares keep theirs"""
+        notes = self.notes
+        for i in range(position, len(self._order)):
+            self.assignments[self._order[i][2]] = notes[i % len(notes)] if notes else 'C'
+        self.version += 1
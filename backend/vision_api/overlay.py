@@ -0,0 +1,76 @@
+"""
+Cached overlay layer for the annotated output frames.
+
+``OverlayLayer`` keeps the slowly changing annotations (stable square
+outlines, note labels, the instrument/scale header) pre-rendered in a BGR
+layer with a separate alpha plane, and remembers the regions it drew into.
+Compositing is a masked ``cv2.copyTo`` of those regions only. The layer is
+rebuilt when its key changes or its anchors drift past a tolerance.
+"""
+
+import cv2
+import numpy as np
+
+
+class OverlayLayer:
+    """Pre-rendered annotations (color plus alpha), composited onto frames by dirty region"""
+
+    def __init__(self):
+        self.key = None
+        self.anchors = None
+        self.color = None
+        self.alpha = None
+        self.regions = []
+        self.rebuilds = 0
+
+    @property
+    def nbytes(self):
+        return 0 if self.color is None else self.color.nbytes + self.alpha.nbytes
+
+    def is_current(self, key, anchors=None, tolerance=0):
+        """Built for ``key``, with every anchor within ``tolerance`` px of where it was drawn"""
+        if self.color is None or key != self.key:
+            return False
+        if anchors is None or self.anchors is None:
+            return True
+        return np.abs(np.asarray(anchors) - self.anchors).max(initial=0) <= tolerance
+
+    def begin(self, key, shape, anchors=None):
+        """Start a rebuild for ``key`` on frames of ``shape``, drawn at ``anchors`` (e.g. bboxes)"""
+        height, width = shape[:2]
+        if self.color is None or self.color.shape[:2] != (height, width):
+            self.color = np.zeros((height, width, 3), dtype=np.uint8)
+            self.alpha = np.zeros((height, width), dtype=np.uint8)
+        else:
+            for x0, y0, x1, y1 in self.regions:
+                self.alpha[y0:y1, x0:x1] = 0
+        self.key = key
+        self.anchors = None if anchors is None else np.asarray(anchors)
+        self.regions = []
+        self.rebuilds += 1
+
+    def _mark(self, x0, y0, x1, y1):
+        height, width = self.alpha.shape
+        x0, y0 = max(int(x0), 0), max(int(y0), 0)
+        x1, y1 = min(int(x1), width), min(int(y1), height)
+        if x1 > x0 and y1 > y0:
+            self.regions.append((x0, y0, x1, y1))
+
+    def rectangle(self, pt1, pt2, color, thickness):
+        cv2.rectangle(self.color, pt1, pt2, color, thickness)
+        cv2.rectangle(self.alpha, pt1, pt2, 255, thickness)
+        pad = thickness // 2 + 1
+        self._mark(pt1[0] - pad, pt1[1] - pad, pt2[0] + pad + 1, pt2[1] + pad + 1)
+
+    def text(self, text, org, scale, color, thickness, font=cv2.FONT_HERSHEY_SIMPLEX):
+        cv2.putText(self.color, text, org, font, scale, color, thickness)
+        cv2.putText(self.alpha, text, org, font, scale, 255, thickness)
+        (w, h), baseline = cv2.getTextSize(text, font, scale, thickness)
+        x, y = org
+        self._mark(x - thickness, y - h - thickness, x + w + thickness, y + baseline + thickness)
+
+    def composite(self, image):
+        """Copy the layer's opaque pixels onto ``image`` in place, region by region"""
+        for x0, y0, x1, y1 in self.regions:
+            cv2.copyTo(self.color[y0:y1, x0:x1], self.alpha[y0:y1, x0:x1], image[y0:y1, x0:x1])
+        return image
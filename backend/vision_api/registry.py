@@ -0,0 +1,217 @@
+"""
+Lazy registry of the SquareDetector instances used by the views.
+
+Detectors are built on first use instead of at import time, so workers that
+only serve the lesson/PDF endpoints never touch the audio device or the
+sample banks. Detectors for the same instrument share one sound bank, and
+each detector publishes its note events on the session named after it.
+Deployments that want CV workers ready before the first request can call
+``warm_up()`` (for example from a Gunicorn ``post_fork`` hook) or run the
+``warm_detectors`` management command to pre-fill the on-disk sample cache
+(and check that the square verifier model loads, when it is enabled).
+
+``DetectorPool`` hands out one isolated detector per client session (square
+tracks, background model, note layout), for endpoints where each learner
+sends their own frames. Sound banks and kernels stay shared, and pool
+detectors play nothing on the server: their notes reach the client only as
+events. A detector is not safe to use from two threads at once, so callers
+hold the session's lock while they use it (``with sessions.session(...)``). Sessions are evicted when idle
+for too long, least recently used first when the pool is over its session or
+memory limit.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import partial
+
+from .audio_output import NullSink
+from .cv_processor import SquareDetector
+from .events import note_events
+from .sample_cache import get_sample_bank
+from .verifier import square_verifier
+
+logger = logging.getLogger(__name__)
+
+# Detector name -> instrument it plays
+DETECTOR_INSTRUMENTS = {
+    'piano': 'piano',
+    'drums': 'drums',
+    'flute': 'flute',
+    'default': 'piano',
+}
+
+
+class DetectorRegistry:
+    """Builds detectors on first use and shares sound banks per instrument"""
+
+    def __init__(self, factory=SquareDetector):
+        self.factory = factory
+        self._detectors = {}
+        self._sound_banks = {}
+        self._lock = threading.RLock()
+
+    def get(self, name="default"):
+        """Return the detector registered under ``name``, building it if needed"""
+        if name not in DETECTOR_INSTRUMENTS:
+            raise KeyError(f"Unknown detector '{name}'. Available: {list(DETECTOR_INSTRUMENTS)}")
+
+        detector = self._detectors.get(name)
+        if detector is not None:
+            return detector
+
+        with self._lock:
+            detector = self._detectors.get(name)
+            if detector is None:
+                instrument_type = DETECTOR_INSTRUMENTS[name]
+                started = time.perf_counter()
+                detector = self.factory(
+                    instrument_type=instrument_type,
+                    instrument_sounds=self._sound_banks.get(instrument_type),
+                    event_channel=partial(note_events.publish, name),
+                )
+                self._sound_banks.setdefault(instrument_type, detector.instrument_sounds)
+                self._detectors[name] = detector
+                logger.info("Built %s detector in %.1f ms", name, (time.perf_counter() - started) * 1000)
+            return detector
+
+    def shared_bank(self, instrument_type):
+        """Sound bank shared by every detector of an instrument (loaded once per process)"""
+        with self._lock:
+            bank = self._sound_banks.get(instrument_type)
+            if bank is None:
+                bank = self._sound_banks[instrument_type] = get_sample_bank(instrument_type)
+            return bank
+
+    def peek(self, name):
+        """Return the detector if it has already been built, without building it"""
+        return self._detectors.get(name)
+
+    def available_notes(self, name):
+        """Current note sequence for a detector, or the default if it is not built yet"""
+        detector = self.peek(name)
+        return detector.available_notes if detector is not None else list(SquareDetector.DEFAULT_NOTES)
+
+    def stats(self):
+        """Stats snapshot of every detector built so far"""
+        return {name: detector.stats.snapshot() for name, detector in sorted(self._detectors.items())}
+
+    def warm_up(self, names=None):
+        """Explicitly build detectors (default: all of them) ahead of traffic"""
+        for name in names or DETECTOR_INSTRUMENTS:
+            self.get(name)
+        return sorted(self._detectors)
+
+
+class DetectorPool:
+    """Session id -> isolated detector, with idle timeout and LRU eviction"""
+
+    def __init__(self, factory=SquareDetector, max_sessions=None, idle_timeout=None, max_bytes=None, publish=None):
+        self.factory = factory
+        self.publish = publish or note_events.publish
+        self.max_sessions = max_sessions or int(os.getenv('LEADZEPPELIN_SESSION_LIMIT', '64'))
+        self.idle_timeout = idle_timeout or float(os.getenv('LEADZEPPELIN_SESSION_IDLE_SECONDS', '300'))
+        self.max_bytes = max_bytes or int(os.getenv('LEADZEPPELIN_SESSION_MEMORY_MB', '512')) * 1024 * 1024
+        self.created = 0
+        self.evictions = Counter()
+        self._sessions = OrderedDict()  # session id -> (detector, last_used), oldest first
+        self._session_locks = {}  # session id -> lock serializing use of its detector
+        self._lock = threading.Lock()
+
+    def get(self, session_id, instrument_type='piano'):
+        """Detector for ``session_id``, created (or rebuilt for a new instrument) on demand"""
+        return self._checkout(session_id, instrument_type)[0]
+
+    @contextmanager
+    def session(self, session_id, instrument_type='piano'):
+        """Detector for ``session_id``, used exclusively for the duration of the block"""
+        detector, lock = self._checkout(session_id, instrument_type)
+        with lock:
+            yield detector
+
+    def _checkout(self, session_id, instrument_type):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None and entry[0].instrument_type == instrument_type:
+                detector = entry[0]
+            else:
+                detector = self.factory(
+                    instrument_type=instrument_type,
+                    instrument_sounds=detectors.shared_bank(instrument_type),
+                    event_channel=partial(self.publish, session_id),
+                    audio_sink=NullSink(),  # Remote sessions play in their browser, not on the server
+                )
+                self.created += 1
+            self._sessions[session_id] = (detector, now)
+            lock = self._session_locks.setdefault(session_id, threading.Lock())
+            self._evict(now)
+            return detector, lock
+
+    def release(self, session_id):
+        with self._lock:
+            self._session_locks.pop(session_id, None)
+            return self._sessions.pop(session_id, None) is not None
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(detector.memory_bytes() for detector, _ in self._sessions.values())
+
+    def _evict(self, now):
+        for session_id, (_, last_used) in list(self._sessions.items()):
+            if now - last_used > self.idle_timeout:
+                self._drop(session_id, 'idle')
+
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)), 'lru')
+
+        # Never evict the session that is being served (the newest entry)
+        while len(self._sessions) > 1 and sum(d.memory_bytes() for d, _ in self._sessions.values()) > self.max_bytes:
+            self._drop(next(iter(self._sessions)), 'memory')
+
+    def _drop(self, session_id, reason):
+        # A caller still holding the evicted detector keeps its lock; a new detector gets a new one
+        del self._sessions[session_id]
+        self._session_locks.pop(session_id, None)
+        self.evictions[reason] += 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            sessions = {
+                session_id: {
+                    'instrument': detector.instrument_type,
+                    'idle_seconds': now - last_used,
+                    'memory_bytes': detector.memory_bytes(),
+                    'frames': detector.stats.frames,
+                }
+                for session_id, (detector, last_used) in self._sessions.items()
+            }
+        return {
+            'active_sessions': len(sessions),
+            'created': self.created,
+            'evictions': dict(self.evictions),
+            'memory_bytes': sum(session['memory_bytes'] for session in sessions.values()),
+            'limits': {'sessions': self.max_sessions, 'idle_seconds': self.idle_timeout, 'memory_bytes': self.max_bytes},
+            'sessions': sessions,
+        }
+
+
+detectors = DetectorRegistry()
+sessions = DetectorPool()
+
+
+def warm_up(names=None):
+    """Warm-up hook for deployments: build the named detectors (and load the square verifier) in this process"""
+    if square_verifier.enabled:
+        square_verifier.warm_up()
+    return detectors.warm_up(names)
@@ -0,0 +1,121 @@
+"""
+On-disk cache of rendered instrument sample banks.
+
+A bank is stored as one int16 ``.npy`` file holding every note's PCM back to
+back, plus a small JSON index of ``note -> [start, stop]`` frame offsets. The
+``.npy`` file is opened with ``mmap_mode='r'`` so every detector in a process,
+and every worker process on the box, shares the same page-cache copy of the
+waveforms instead of re-synthesizing them. Files are keyed by instrument,
+sample rate and a hash of the synthesis parameters, so changing a voice simply
+produces a new cache entry.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from . import synthesis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / '.sample_cache'
+
+
+def bank_cache_key(instrument_type, sample_rate=synthesis.SAMPLE_RATE):
+    """Stable file-name key for a bank: instrument, sample rate and parameter hash"""
+    params = synthesis.bank_parameters(instrument_type, sample_rate)
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return f"{params['instrument']}-{sample_rate}-{digest}"
+
+
+class SampleBankCache:
+    """Process-wide store of rendered banks backed by memory-mapped files"""
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = Path(cache_dir or os.getenv('LEADZEPPELIN_SAMPLE_CACHE', DEFAULT_CACHE_DIR))
+        self._banks = {}
+        self._lock = threading.Lock()
+
+    def get_bank(self, instrument_type, sample_rate=synthesis.SAMPLE_RATE):
+        """Return ``{note: pcm}`` for an instrument, rendering and persisting it on first use"""
+        key = bank_cache_key(instrument_type, sample_rate)
+        with self._lock:
+            bank = self._banks.get(key)
+            if bank is None:
+                bank = self._load(key)
+                if bank is None:
+                    bank = self._render_and_store(key, instrument_type, sample_rate)
+                self._banks[key] = bank
+            return bank
+
+    def clear_memory(self):
+        """Drop in-process references; files on disk are kept"""
+        with self._lock:
+            self._banks.clear()
+
+    def _paths(self, key):
+        return self.cache_dir / f"{key}.npy", self.cache_dir / f"{key}.json"
+
+    def _load(self, key):
+        pcm_path, index_path = self._paths(key)
+        if not (pcm_path.exists() and index_path.exists()):
+            return None
+        try:
+            index = json.loads(index_path.read_text())
+            pcm = np.load(pcm_path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable sample bank %s: %s", key, e)
+            return None
+        return {note: pcm[start:stop] for note, (start, stop) in index.items()}
+
+    def _render_and_store(self, key, instrument_type, sample_rate):
+        # Seed from the key so every process renders byte-identical noise
+        seed = int(key.rsplit('-', 1)[1], 16)
+        bank = synthesis.render_instrument_bank(instrument_type, sample_rate, np.random.default_rng(seed))
+
+        # Aliased notes (e.g. 'C' and 'C4') share one array and are stored once
+        index, offset, stored, chunks = {}, 0, {}, []
+        for note, pcm in bank.items():
+            if id(pcm) not in stored:
+                stored[id(pcm)] = [offset, offset + len(pcm)]
+                chunks.append(pcm)
+                offset += len(pcm)
+            index[note] = stored[id(pcm)]
+
+        try:
+            self._write(key, np.concatenate(chunks), index)
+        except OSError as e:
+            logger.warning("Could not persist sample bank %s, keeping it in memory: %s", key, e)
+            return bank
+
+        logger.info("Rendered and cached %s sample bank (%d notes)", instrument_type, len(bank))
+        return self._load(key) or bank
+
+    def _write(self, key, pcm, index):
+        """Write atomically so concurrent workers never map a half-written file"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        pcm_path, index_path = self._paths(key)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+
+        tmp_pcm = pcm_path.with_name(pcm_path.name + suffix)
+        with open(tmp_pcm, 'wb') as f:
+            np.save(f, pcm)
+        os.replace(tmp_pcm, pcm_path)
+
+        # The index is written last: its presence marks a complete entry
+        tmp_index = index_path.with_name(index_path.name + suffix)
+        tmp_index.write_text(json.dumps(index))
+        os.replace(tmp_index, index_path)
+
+
+default_cache = SampleBankCache()
+
+
+def get_sample_bank(instrument_type, sample_rate=synthesis.SAMPLE_RATE):
+    """Shared bank for an instrument from the default cache"""
+    return default_cache.get_bank(instrument_type, sample_rate)
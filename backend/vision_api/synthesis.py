@@ -0,0 +1,240 @@
+"""
+Vectorized NumPy synthesis of the instrument voices used by SquareDetector.
+
+Every tone is rendered as whole-array operations (time axis, envelope,
+harmonics and noise). The functions return int16 stereo PCM arrays of shape
+(frames, 2) that can be handed to pygame or any other audio backend.
+"""
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+
+# Bump whenever the rendering code changes so cached banks are re-rendered
+SYNTHESIS_VERSION = 2
+
+INSTRUMENTS = ('piano', 'drums', 'flute')
+
+NOTE_NAMES = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+SHARP_TO_FLAT = {'C#': 'Db', 'D#': 'Eb', 'F#': 'Gb', 'G#': 'Ab', 'A#': 'Bb'}
+
+PIANO_BASE_FREQUENCY = 261.63  # C4
+FLUTE_BASE_FREQUENCY = 523.25  # C5 (higher octave for flute)
+
+# Octaves in each pitched bank; bare note names ('C') resolve to the default octave
+PIANO_OCTAVES = (4, 5, 6)
+FLUTE_OCTAVES = (4, 5, 6)
+PIANO_DEFAULT_OCTAVE = 4
+FLUTE_DEFAULT_OCTAVE = 5
+
+# Only every ROOT_SPACING-th semitone is synthesized; the notes in between are
+# resampled from the nearest root, so no note is shifted by more than 3 semitones
+ROOT_SPACING = 6
+
+PIANO_DURATION = 0.8
+FLUTE_DURATION = 1.0
+DRUM_DURATION = 0.3  # Shorter duration for drums
+
+PIANO_AMPLITUDE = 16383  # Reduced volume
+DRUM_AMPLITUDE = 20000   # Higher volume for drums
+FLUTE_AMPLITUDE = 12000  # Moderate volume
+
+# Map musical notes to drum sounds with different frequencies and characteristics
+DRUM_MAPPING = {
+    'C': {'freq': 80, 'type': 'kick'},      # Kick drum
+    'D': {'freq': 120, 'type': 'snare'},    # Snare
+    'E': {'freq': 200, 'type': 'hihat'},    # Hi-hat
+    'F': {'freq': 150, 'type': 'tom1'},     # Tom 1
+    'G': {'freq': 100, 'type': 'tom2'},     # Tom 2
+    'A': {'freq': 250, 'type': 'crash'},    # Crash
+    'B': {'freq': 220, 'type': 'ride'},     # Ride
+    'Db': {'freq': 80, 'type': 'kick'},     # Alternative kick
+    'Eb': {'freq': 140, 'type': 'snare'},   # Alternative snare
+    'Gb': {'freq': 180, 'type': 'tom3'},    # Tom 3
+    'Ab': {'freq': 220, 'type': 'hihat'},   # Open hi-hat
+    'Bb': {'freq': 280, 'type': 'crash'}    # Splash
+}
+
+
+def _to_stereo_pcm(arr, amplitude):
+    """Scale a float waveform to int16 and duplicate it into two channels"""
+    mono = (arr * amplitude).astype(np.int16)
+    return np.column_stack((mono, mono))
+
+
+def _sine(frequency, i, sample_rate):
+    return np.sin(2 * np.pi * frequency * i / sample_rate)
+
+
+def render_piano_tone(frequency, duration, sample_rate=SAMPLE_RATE):
+    """Render a piano-like tone with harmonics, attack and exponential decay"""
+    frames = int(duration * sample_rate)
+    i = np.arange(frames, dtype=np.float64)
+
+    # Piano has complex harmonics
+    arr = (_sine(frequency, i, sample_rate)
+           + 0.5 * _sine(frequency * 2, i, sample_rate)
+           + 0.25 * _sine(frequency * 3, i, sample_rate))
+
+    # Exponential decay with a linear attack over the first 10%
+    envelope = np.exp(-3 * i / frames)
+    attack = i < frames * 0.1
+    envelope[attack] *= i[attack] / (frames * 0.1)
+
+    return _to_stereo_pcm(arr * envelope, PIANO_AMPLITUDE)
+
+
+def render_drum_sound(frequency, drum_type, sample_rate=SAMPLE_RATE, rng=None):
+    """Render a percussion hit; kick/snare/hihat are special-cased, the rest are metallic"""
+    rng = rng if rng is not None else np.random.default_rng()
+    frames = int(DRUM_DURATION * sample_rate)
+    i = np.arange(frames, dtype=np.float64)
+
+    if drum_type == 'kick':
+        # Low frequency with quick decay
+        arr = _sine(frequency, i, sample_rate) * np.exp(-8 * i / frames)
+
+    elif drum_type == 'snare':
+        # Mix of tone and noise
+        tone = _sine(frequency, i, sample_rate)
+        noise = rng.normal(0, 0.3, frames)
+        arr = (0.3 * tone + 0.7 * noise) * np.exp(-5 * i / frames)
+
+    elif drum_type == 'hihat':
+        # High frequency noise
+        noise = rng.normal(0, 0.5, frames)
+        high_freq = _sine(frequency, i, sample_rate)
+        arr = (0.2 * high_freq + 0.8 * noise) * np.exp(-10 * i / frames)
+
+    else:  # toms, crash, ride
+        # Metallic sound with overtones
+        fundamental = _sine(frequency, i, sample_rate)
+        overtone = 0.3 * _sine(frequency * 1.6, i, sample_rate)
+        arr = (fundamental + overtone) * np.exp(-4 * i / frames)
+
+    return _to_stereo_pcm(arr, DRUM_AMPLITUDE)
+
+
+def render_flute_tone(frequency, duration, sample_rate=SAMPLE_RATE, rng=None):
+    """Render a flute-like tone: mostly fundamental, a little breath noise, soft attack/release"""
+    rng = rng if rng is not None else np.random.default_rng()
+    frames = int(duration * sample_rate)
+    i = np.arange(frames, dtype=np.float64)
+
+    # Flute is mostly fundamental with some second harmonic and slight breathiness
+    arr = (_sine(frequency, i, sample_rate)
+           + 0.2 * _sine(frequency * 2, i, sample_rate)
+           + rng.normal(0, 0.05, frames))
+
+    # Gentle attack (first 15%), sustain, and release (last 20%)
+    envelope = np.ones(frames)
+    attack = i < frames * 0.15
+    release = i > frames * 0.8
+    envelope[attack] = i[attack] / (frames * 0.15)
+    envelope[release] = (frames - i[release]) / (frames * 0.2)
+
+    return _to_stereo_pcm(arr * envelope, FLUTE_AMPLITUDE)
+
+
+def parse_note(note):
+    """Split 'Eb5' into ('Eb', 5); bare names like 'C' return ('C', None)"""
+    name, octave = note.rstrip('0123456789'), note[len(note.rstrip('0123456789')):]
+    name = SHARP_TO_FLAT.get(name, name)
+    return name, int(octave) if octave else None
+
+
+def pitch_shift(pcm, ratio):
+    """Resample ``pcm`` so it plays ``ratio`` times higher (and proportionally shorter)"""
+    if ratio == 1.0:
+        return pcm
+    frames = int(len(pcm) / ratio)
+    positions = np.arange(frames) * ratio
+    mono = np.interp(positions, np.arange(len(pcm)), pcm[:, 0]).astype(np.int16)
+    return np.column_stack((mono, mono))
+
+
+def _render_pitched_bank(render_root, base_frequency, base_octave, octaves, default_octave):
+    """Render root tones every ROOT_SPACING semitones and resample the notes in between"""
+    roots = {}
+    bank = {}
+    for octave in octaves:
+        for i, name in enumerate(NOTE_NAMES):
+            semitone = (octave - base_octave) * 12 + i
+            root = int(round(semitone / ROOT_SPACING)) * ROOT_SPACING
+            if root not in roots:
+                roots[root] = render_root(base_frequency * (2 ** (root / 12)))
+            bank[f"{name}{octave}"] = pitch_shift(roots[root], 2 ** ((semitone - root) / 12))
+
+    # Bare names are aliases of the default octave and share its array
+    for name in NOTE_NAMES:
+        bank[name] = bank[f"{name}{default_octave}"]
+    return bank
+
+
+def render_piano_bank(sample_rate=SAMPLE_RATE):
+    """Render piano notes over PIANO_OCTAVES (C4-B6)"""
+    return _render_pitched_bank(
+        lambda frequency: render_piano_tone(frequency, PIANO_DURATION, sample_rate),
+        PIANO_BASE_FREQUENCY, 4, PIANO_OCTAVES, PIANO_DEFAULT_OCTAVE,
+    )
+
+
+def render_drum_bank(sample_rate=SAMPLE_RATE, rng=None):
+    """Render the drum kit, one percussion voice per note name"""
+    rng = rng if rng is not None else np.random.default_rng()
+    return {
+        note: render_drum_sound(info['freq'], info['type'], sample_rate, rng)
+        for note, info in DRUM_MAPPING.items()
+    }
+
+
+def render_flute_bank(sample_rate=SAMPLE_RATE, rng=None):
+    """Render flute notes over FLUTE_OCTAVES (C4-B6)"""
+    rng = rng if rng is not None else np.random.default_rng()
+    return _render_pitched_bank(
+        lambda frequency: render_flute_tone(frequency, FLUTE_DURATION, sample_rate, rng),
+        FLUTE_BASE_FREQUENCY, 5, FLUTE_OCTAVES, FLUTE_DEFAULT_OCTAVE,
+    )
+
+
+def normalize_instrument(instrument_type):
+    """Map unknown instrument names to the piano fallback"""
+    return instrument_type if instrument_type in INSTRUMENTS else "piano"
+
+
+def bank_parameters(instrument_type, sample_rate=SAMPLE_RATE):
+    """Everything that determines the rendered bank, used to key cached PCM"""
+    instrument_type = normalize_instrument(instrument_type)
+    params = {'version': SYNTHESIS_VERSION, 'instrument': instrument_type, 'sample_rate': sample_rate}
+    if instrument_type == "drums":
+        params.update(duration=DRUM_DURATION, amplitude=DRUM_AMPLITUDE, mapping=DRUM_MAPPING)
+    elif instrument_type == "flute":
+        params.update(base_frequency=FLUTE_BASE_FREQUENCY, duration=FLUTE_DURATION,
+                      amplitude=FLUTE_AMPLITUDE, notes=NOTE_NAMES, octaves=FLUTE_OCTAVES,
+                      default_octave=FLUTE_DEFAULT_OCTAVE, root_spacing=ROOT_SPACING)
+    else:
+        params.update(base_frequency=PIANO_BASE_FREQUENCY, duration=PIANO_DURATION,
+                      amplitude=PIANO_AMPLITUDE, notes=NOTE_NAMES, octaves=PIANO_OCTAVES,
+                      default_octave=PIANO_DEFAULT_OCTAVE, root_spacing=ROOT_SPACING)
+    return params
+
+
+def resolve_note(bank, note):
+    """Key in ``bank`` for a note like 'C', 'C#5' or 'Eb4'; octaves are dropped for unpitched banks"""
+    if note in bank:
+        return note
+    name, octave = parse_note(note)
+    for candidate in (f"{name}{octave}" if octave is not None else name, name):
+        if candidate in bank:
+            return candidate
+    return None
+
+
+def render_instrument_bank(instrument_type, sample_rate=SAMPLE_RATE, rng=None):
+    """Render the full note bank for an instrument (unknown instruments fall back to piano)"""
+    instrument_type = normalize_instrument(instrument_type)
+    if instrument_type == "drums":
+        return render_drum_bank(sample_rate, rng)
+    elif instrument_type == "flute":
+        return render_flute_bank(sample_rate, rng)
+    return render_piano_bank(sample_rate)
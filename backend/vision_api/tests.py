@@ -1,9 +1,36 @@
 from dotenv import load_dotenv
+import base64
+import json
 import os
-from django.test import TestCase
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, SimpleTestCase
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
+import cv2
+import numpy as np
+
+from . import synthesis
+from .audio_output import AudioSink, NullSink, OfflineRenderSink, get_default_sink
+from .broadcast import FrameBroadcaster, LatestSlot
+from .capture import CaptureService
+from .cv_processor import SquareDetector, region_fractions
+from .events import NoteEventBus, note_events
+from .frame_context import FrameContext
+from .mixer import MixerSink, VoiceMixer
+from .note_layout import NoteLayout
+from .overlay import OverlayLayer
+from .registry import DetectorPool, DetectorRegistry, sessions
+from .sample_cache import SampleBankCache, bank_cache_key
+from .tracking import SquareTracker
+from .verifier import SquareVerifier
+from .workers import ShardOverloaded, ShardedExecutor, executor
 
 load_dotenv()  # ensure .env variables are loaded for tests
 
@@ -52,4 +79,826 @@ class ParseNotesViewTests(APITestCase):
         # Optionally validate types and non-empty data
         self.assertIsInstance(response.data['parsed_notes'], list)
         self.assertTrue(len(response.data['parsed_notes']) > 0)
-        self.assertIsInstance(response.data['shapes'], dict)
\ No newline at end of file
+        self.assertIsInstance(response.data['shapes'], dict)
+
+class SynthesisTests(SimpleTestCase):
+    def test_piano_tone_matches_per_sample_reference(self):
+        frequency, sample_rate = 261.63, 22050
+        frames = int(0.8 * sample_rate)
+        expected = np.zeros(frames)
+        for i in range(0, frames, 97):
+            harmonics = (np.sin(2 * np.pi * frequency * i / sample_rate)
+                         + 0.5 * np.sin(2 * np.pi * frequency * 2 * i / sample_rate)
+                         + 0.25 * np.sin(2 * np.pi * frequency * 3 * i / sample_rate))
+            envelope = np.exp(-3 * i / frames)
+            if i < frames * 0.1:
+                envelope *= (i / (frames * 0.1))
+            expected[i] = harmonics * envelope
+
+        pcm = synthesis.render_piano_tone(frequency, 0.8)
+
+        self.assertEqual(pcm.shape, (frames, 2))
+        self.assertEqual(pcm.dtype, np.int16)
+        np.testing.assert_array_equal(pcm[::97, 0], (expected[::97] * 16383).astype(np.int16))
+        np.testing.assert_array_equal(pcm[:, 0], pcm[:, 1])
+
+    def test_instrument_banks_cover_all_note_names(self):
+        for instrument in ('piano', 'drums', 'flute'):
+            bank = synthesis.render_instrument_bank(instrument)
+            self.assertTrue(set(synthesis.NOTE_NAMES) <= set(bank))
+
+    def test_pitched_banks_span_octaves_by_resampling_roots(self):
+        bank = synthesis.render_piano_bank()
+        self.assertIn('C4', bank)
+        self.assertIn('B6', bank)
+        self.assertIs(bank['E'], bank['E4'])
+
+        # A4 is resampled from the Gb4 root; its spectral peak must still be 440 Hz
+        spectrum = np.abs(np.fft.rfft(bank['A4'][:, 0].astype(float)))
+        peak_hz = np.argmax(spectrum) * synthesis.SAMPLE_RATE / len(bank['A4'])
+        self.assertAlmostEqual(peak_hz, 440.0, delta=2.0)
+
+    def test_resolve_note_handles_octaves_and_sharps(self):
+        piano = synthesis.render_piano_bank()
+        drums = synthesis.render_drum_bank()
+        self.assertEqual(synthesis.resolve_note(piano, 'F#5'), 'Gb5')
+        self.assertEqual(synthesis.resolve_note(drums, 'E5'), 'E')
+        self.assertIsNone(synthesis.resolve_note(piano, 'H2'))
+
+
+class SampleBankCacheTests(SimpleTestCase):
+    def test_bank_is_persisted_and_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = SampleBankCache(cache_dir)
+            first = cache.get_bank('drums')
+            self.assertIs(cache.get_bank('drums'), first)
+
+            reloaded = SampleBankCache(cache_dir).get_bank('drums')
+            self.assertIsInstance(reloaded['C'].base, np.memmap)
+            for note, pcm in first.items():
+                np.testing.assert_array_equal(reloaded[note], pcm)
+
+    def test_key_tracks_sample_rate_and_instrument(self):
+        self.assertNotEqual(bank_cache_key('piano', 22050), bank_cache_key('piano', 44100))
+        self.assertNotEqual(bank_cache_key('piano'), bank_cache_key('flute'))
+        self.assertEqual(bank_cache_key('unknown'), bank_cache_key('piano'))
+
+
+class DetectorRegistryTests(SimpleTestCase):
+    class FakeDetector:
+        built = 0
+
+        def __init__(self, instrument_type, instrument_sounds=None, **kwargs):
+            type(self).built += 1
+            self.instrument_type = instrument_type
+            self.instrument_sounds = instrument_sounds if instrument_sounds is not None else {'C': object()}
+            self.available_notes = ['C', 'E', 'G']
+
+    def test_detectors_are_built_lazily_and_share_banks(self):
+        self.FakeDetector.built = 0
+        registry = DetectorRegistry(factory=self.FakeDetector)
+        self.assertIsNone(registry.peek('piano'))
+        self.assertEqual(registry.available_notes('piano'), SquareDetector.DEFAULT_NOTES)
+        self.assertEqual(self.FakeDetector.built, 0)
+
+        piano = registry.get('piano')
+        self.assertIs(registry.get('piano'), piano)
+        self.assertIs(registry.get('default').instrument_sounds, piano.instrument_sounds)
+        self.assertEqual(self.FakeDetector.built, 2)
+
+        self.assertEqual(registry.warm_up(), ['default', 'drums', 'flute', 'piano'])
+        self.assertEqual(self.FakeDetector.built, 4)
+
+
+class DetectorPoolTests(SimpleTestCase):
+    def test_sessions_get_isolated_state_and_shared_banks(self):
+        pool = DetectorPool(max_sessions=4, idle_timeout=60, max_bytes=1 << 30)
+        alice, bob = pool.get('alice'), pool.get('bob')
+        for _ in range(4):
+            alice.process_frame(draw_board())
+
+        self.assertIsNot(alice, bob)
+        self.assertIs(alice.instrument_sounds, bob.instrument_sounds)
+        self.assertIsInstance(alice.audio_sink, NullSink)
+        self.assertIsNot(alice.audio_sink, get_default_sink())  # never the server's audio device
+        self.assertEqual((len(alice.tracker), len(bob.tracker)), (5, 0))
+        self.assertIs(pool.get('alice'), alice)
+        self.assertIsNot(pool.get('alice', 'drums'), alice)
+
+    def test_lru_idle_and_memory_eviction(self):
+        pool = DetectorPool(max_sessions=2, idle_timeout=60, max_bytes=1 << 30)
+        for session_id in ('a', 'b', 'a', 'c'):
+            pool.get(session_id)
+        self.assertEqual(sorted(pool.stats()['sessions']), ['a', 'c'])
+
+        pool.idle_timeout = 1e-9
+        pool.get('d')
+        self.assertEqual(list(pool.stats()['sessions']), ['d'])
+
+        pool = DetectorPool(max_sessions=8, idle_timeout=60, max_bytes=1)
+        pool.get('x')
+        pool.get('y')  # the session being served is never evicted, even over the cap
+        stats = pool.stats()
+        self.assertEqual((list(stats['sessions']), stats['evictions']), (['y'], {'memory': 1}))
+
+
+    def test_a_session_is_used_by_one_thread_at_a_time(self):
+        pool = DetectorPool(max_sessions=4, idle_timeout=60, max_bytes=1 << 30)
+        inside, overlaps = [], []
+
+        def use():
+            with pool.session('shared') as detector:
+                overlaps.append(len(inside))
+                inside.append(detector)
+                time.sleep(0.01)
+                inside.pop()
+
+        threads = [threading.Thread(target=use) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(overlaps, [0, 0, 0, 0])
+        with pool.session('other'):
+            self.assertTrue(pool._session_locks['other'].locked())
+            self.assertFalse(pool._session_locks['shared'].locked())
+
+
+class SessionKeyTests(TestCase):
+    def setUp(self):
+        # Sessions are inspected in this process's pool
+        self.enterContext(mock.patch.object(executor, 'workers', 0))
+
+    def test_clients_without_an_id_get_their_own_cookie_session(self):
+        body = cv2.imencode('.jpg', draw_board())[1].tobytes()
+        first, second = self.client_class(), self.client_class()
+        for client in (first, second, first):
+            response = client.post('/api/ingest-frames/', body, content_type='image/jpeg')
+            self.assertEqual(response.status_code, 200)
+
+        first_key, second_key = (f"web-{client.session.session_key}" for client in (first, second))
+        for key in (first_key, second_key):
+            self.addCleanup(sessions.release, key)
+        self.assertNotEqual(first_key, second_key)
+        self.assertEqual((sessions.get(first_key).frame_count, sessions.get(second_key).frame_count), (2, 1))
+
+    def test_note_events_default_to_the_cookie_session(self):
+        body = cv2.imencode('.jpg', draw_board())[1].tobytes()
+        self.client.post('/api/ingest-frames/', body, content_type='image/jpeg')
+        key = f"web-{self.client.session.session_key}"
+        self.addCleanup(sessions.release, key)
+
+        response = self.client.get('/api/note-events/')
+        self.assertEqual(next(response.streaming_content), b'retry: 1000\n\n')
+        self.assertEqual(note_events.subscriber_count(key), 1)
+        response.close()
+        self.assertEqual(note_events.subscriber_count(key), 0)
+
+class AudioSinkTests(SimpleTestCase):
+    def test_detector_plays_through_sink(self):
+        sink = NullSink()
+        detector = SquareDetector(instrument_type='drums', audio_sink=sink)
+        detector.square_note_assignments['sq'] = 'E'
+
+        detector.play_instrument_note('sq')
+        detector.play_instrument_note('sq')  # within cooldown
+
+        self.assertEqual([event['note'] for event in sink.events], ['E'])
+
+    def test_notes_are_timed_by_capture_time(self):
+        sink = NullSink()
+        detector = SquareDetector(instrument_type='drums', audio_sink=sink)
+        detector.square_note_assignments['sq'] = 'E'
+
+        # Frames analyzed back to back but captured half a second apart
+        for timestamp in (10.0, 10.2, 10.5):
+            detector.play_instrument_note('sq', timestamp)
+
+        self.assertEqual([event['timestamp'] for event in sink.events], [10.0, 10.5])
+
+    def test_sinks_must_implement_play(self):
+        with self.assertRaises(TypeError):
+            AudioSink()
+
+    def test_offline_render_places_notes_at_timestamps(self):
+        sink = OfflineRenderSink(sample_rate=1000, start_time=10.0)
+        pcm = np.full((4, 2), 1000, dtype=np.int16)
+
+        sink.play('C', pcm, timestamp=10.0)
+        sink.play('D', pcm, gain=0.5, timestamp=10.002)
+        mixed = sink.render()
+
+        np.testing.assert_array_equal(mixed[:, 0], [1000, 1000, 1500, 1500, 500, 500])
+
+
+class VoiceMixerTests(SimpleTestCase):
+    def test_polyphony_limit_steals_oldest_voice(self):
+        mixer = VoiceMixer(max_polyphony=2, block_frames=4, ring_blocks=2)
+        pcm = np.full((8, 2), 100, dtype=np.int16)
+
+        for note in ('C', 'D', 'E'):
+            mixer.trigger(note, pcm)
+
+        self.assertEqual([v.note for v in mixer._voices], ['D', 'E'])
+        self.assertEqual(mixer.stats()['voices_stolen'], 1)
+
+    def test_voices_are_summed_with_gain_and_underruns_counted(self):
+        mixer = VoiceMixer(max_polyphony=4, steal_policy='none', block_frames=4, ring_blocks=2)
+        pcm = np.full((6, 2), 1000, dtype=np.int16)
+        mixer.trigger('C', pcm)
+        mixer.trigger('E', pcm, gain=0.5)
+
+        mixer.pump()
+        out = mixer.read(8)
+        np.testing.assert_array_equal(out[:, 0], [1500] * 6 + [0, 0])
+        self.assertEqual(mixer.active_voices, 0)
+
+        mixer.read(4)
+        self.assertEqual(mixer.underruns, 1)
+
+    def test_sink_counts_underruns_when_its_thread_is_starved(self):
+        class Channel:
+            """Plays each block for its real duration, with one block of queue"""
+            def __init__(self, index):
+                self.ends, self.queued = 0.0, None
+
+            def get_busy(self):
+                if time.perf_counter() >= self.ends and self.queued is not None:
+                    self.ends += self.queued  # The queued block started when the last one ended
+                    self.queued = None
+                return time.perf_counter() < self.ends
+
+            def play(self, sound):
+                self.ends = time.perf_counter() + sound
+
+            def queue(self, sound):
+                self.queued = sound
+
+            def get_queue(self):
+                return self.queued
+
+        pygame = SimpleNamespace(
+            mixer=SimpleNamespace(init=lambda **kwargs: None, quit=lambda: None, Channel=Channel),
+            sndarray=SimpleNamespace(make_sound=lambda pcm: len(pcm) / 44100),
+        )
+        self.enterContext(mock.patch.dict(sys.modules, {'pygame': pygame}))
+        switch_interval = sys.getswitchinterval()
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+
+        sink = MixerSink(VoiceMixer(block_frames=64), sample_rate=44100)  # 1.5 ms blocks
+        self.addCleanup(sink.close)
+        time.sleep(0.05)
+        # CPU-bound Python on another thread holds the GIL far longer than one block
+        sys.setswitchinterval(0.02)
+        deadline = time.perf_counter() + 0.3
+        while time.perf_counter() < deadline:
+            pass
+        sys.setswitchinterval(switch_interval)
+
+        stats = sink.stats()
+        self.assertGreater(stats['blocks_mixed'], 0)
+        self.assertGreater(stats['underruns'], 0)
+
+
+class VelocityTests(SimpleTestCase):
+    def test_harder_faster_touches_play_louder_from_the_same_sample(self):
+        sink = NullSink()
+        detector = SquareDetector(audio_sink=sink)
+        soft = detector.compute_velocity(0.25, 0.05)
+        hard = detector.compute_velocity(0.9, 0.6)
+        self.assertTrue(0.3 <= soft < hard <= 1.0)
+
+        detector.square_note_assignments.update({'a': 'C', 'b': 'C'})
+        detector.play_instrument_note('a', velocity=soft)
+        detector.play_instrument_note('b', velocity=hard)
+        self.assertEqual([e['gain'] for e in sink.events], [soft, hard])
+
+
+def draw_board(squares=5, touched=None, zoom=1):
+    """Synthetic 640x480 (times ``zoom``) camera frame: a row of drawn squares, optionally one covered by a finger"""
+    k = zoom
+    frame = np.full((480 * k, 640 * k, 3), 220, dtype=np.uint8)
+    for i in range(squares):
+        x = 80 + i * 100
+        cv2.rectangle(frame, (x * k, 200 * k), ((x + 60) * k, 260 * k), (0, 0, 0), 3 * k)
+    if touched is not None:
+        x = 80 + touched * 100
+        cv2.rectangle(frame, ((x + 5) * k, 205 * k), ((x + 55) * k, 255 * k), (40, 90, 160), -1)
+    return frame
+
+
+class PipelineStatsTests(SimpleTestCase):
+    def test_process_frame_records_stage_timings_and_rejections(self):
+        detector = SquareDetector(audio_sink=NullSink(), incremental=False)
+        frame = draw_board()
+        cv2.rectangle(frame, (5, 5), (70, 70), (0, 0, 0), 3)  # touches the edge margin
+        for _ in range(6):
+            detector.process_frame(frame)
+
+        snapshot = detector.stats.snapshot()
+        self.assertEqual(snapshot['frames'], 4)
+        self.assertEqual(snapshot['stages']['detect']['count'], 4)
+        self.assertEqual(snapshot['counters']['squares_accepted'], 20)
+        self.assertEqual(snapshot['rejections']['edge'], 4)
+
+
+class IncrementalDetectionTests(SimpleTestCase):
+    def test_stable_squares_are_revalidated_in_rois_between_full_scans(self):
+        detector = SquareDetector(audio_sink=NullSink(), full_scan_interval=5)
+        frame = draw_board()
+        for _ in range(12):
+            _, squares, _, thresh = detector.process_frame(frame)
+
+        counters = detector.stats.snapshot()['counters']
+        self.assertGreater(counters['roi_scans'], counters['full_scans'])
+        self.assertEqual(sorted(sq['bbox'] for sq in squares),
+                         sorted(sq['bbox'] for sq in detector.detect_small_squares_only(frame)[0]))
+        self.assertEqual(thresh[0:40, :].max(), 0)  # outside every ROI
+
+    def test_squares_drawn_after_the_board_stabilized_are_picked_up(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        for _ in range(10):
+            detector.process_frame(draw_board(squares=3))
+        self.assertEqual(len(detector.note_layout), 3)
+
+        for _ in range(40):
+            detector.process_frame(draw_board(squares=5))
+        self.assertEqual(len(detector.note_layout), 5)
+
+    def test_resting_hand_does_not_shift_the_notes_of_other_squares(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        for _ in range(40):
+            detector.process_frame(draw_board())
+        layout = detector.note_layout
+        notes = [layout.note_for(square_id) for square_id in layout.ordered_ids()]
+
+        hand = draw_board()
+        cv2.rectangle(hand, (270, 190), (350, 480), (40, 90, 160), -1)  # Hand and arm over square 3
+        for _ in range(15):
+            detector.process_frame(hand)
+        self.assertEqual([layout.note_for(square_id) for square_id in layout.ordered_ids()], notes)
+
+    def test_global_scene_change_forces_full_scan(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        for _ in range(5):
+            detector.process_frame(draw_board())
+        full_scans = detector.stats.counters['full_scans']
+
+        detector.process_frame(np.full((480, 640, 3), 30, dtype=np.uint8))
+        self.assertEqual(detector.stats.counters['full_scans'], full_scans + 1)
+
+
+
+class SquareVerifierTests(SimpleTestCase):
+    def test_new_tracks_are_classified_once_in_one_batch(self):
+        batches = []
+
+        def model(batch):
+            batches.append(batch.shape)
+            scores = np.tile([0.1, 0.9], (len(batch), 1))
+            scores[0] = [0.8, 0.2]  # Reject the first candidate
+            return scores
+
+        verifier = SquareVerifier(enabled=True, loader=lambda path: model)
+        detector = SquareDetector(audio_sink=NullSink(), verifier=verifier)
+        for _ in range(8):
+            analysis = detector.analyze_frame(draw_board())
+
+        self.assertEqual(batches, [(5, 32, 32, 1)])
+        self.assertEqual(len(analysis.stable_squares), 4)
+        self.assertEqual(len(detector.note_layout), 4)
+        self.assertEqual(detector.stats.snapshot()['rejections']['verifier'], 1)
+
+    def test_missing_model_accepts_everything(self):
+        verifier = SquareVerifier(enabled=True, loader=lambda path: None)
+        self.assertFalse(verifier.warm_up())
+        self.assertEqual(verifier.verify(np.zeros((480, 640), np.uint8), [(0, 0, 10, 10)] * 2), [True, True])
+
+class DetectionPyramidTests(SimpleTestCase):
+    def test_high_resolution_frames_are_detected_downscaled_and_mapped_back(self):
+        reference, _ = SquareDetector(audio_sink=NullSink()).detect_small_squares_only(draw_board())
+
+        detector = SquareDetector(audio_sink=NullSink())
+        squares, thresh = detector.detect_small_squares_only(draw_board(zoom=3))
+
+        self.assertEqual(thresh.shape, (480, 640))
+        self.assertEqual(len(squares), len(reference))
+        for big, small in zip(sorted(squares, key=lambda sq: sq['center']),
+                              sorted(reference, key=lambda sq: sq['center'])):
+            for coarse, fine in zip(big['bbox'], small['bbox']):
+                self.assertAlmostEqual(coarse, fine * 3, delta=4)
+
+
+class FrameContextTests(SimpleTestCase):
+    def test_planes_are_computed_once_and_shared(self):
+        ctx = FrameContext(draw_board(zoom=2))
+        self.assertIs(ctx.gray, ctx.gray)
+        self.assertEqual(ctx.detection_gray(640, 480).shape, (480, 640))
+        self.assertIs(ctx.detection_blurred(640, 480), ctx.detection_blurred(640, 480))
+        self.assertIs(FrameContext.of(ctx), ctx)
+
+    def test_touch_background_is_a_single_channel_running_average(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        for _ in range(6):
+            detector.process_frame(draw_board())
+        self.assertEqual((detector.background.ndim, detector.background.dtype), (2, np.float32))
+
+        touches = detector.detect_finger_touches(draw_board(touched=2), detector.register_stable_squares(
+            detector.detect_small_squares_only(draw_board())[0]))
+        self.assertEqual(len(touches), 1)
+
+
+class RegionFractionTests(SimpleTestCase):
+    def test_integral_lookup_matches_direct_sums_for_every_box(self):
+        mask = (np.random.default_rng(0).random((120, 160)) > 0.6).astype(np.uint8)
+        boxes = [(0, 0, 160, 120), (10, 20, 30, 40), (150, 100, 20, 20), (5, 5, 0, 10)]
+
+        fractions = region_fractions(cv2.integral(mask), boxes)
+
+        self.assertAlmostEqual(fractions[0], mask.mean())
+        self.assertAlmostEqual(fractions[1], mask[20:60, 10:40].mean())
+        self.assertTrue(np.isnan(fractions[2]) and np.isnan(fractions[3]))
+
+
+class SquareTrackerTests(SimpleTestCase):
+    def detection(self, x, y, size=60):
+        return {'id': None, 'center': (x + size // 2, y + size // 2), 'bbox': (x, y, size, size), 'area': size * size}
+
+    def test_jitter_across_grid_cells_keeps_track_ids(self):
+        tracker = SquareTracker()
+        for dx in (0, 3, -2, 4, -3, 1):
+            stable = tracker.update([self.detection(98 + dx, 148 + dx), self.detection(300, 148)])
+        self.assertEqual(sorted(sq['id'] for sq in stable), ['square_1', 'square_2'])
+
+    def test_reused_slot_starts_from_a_clean_center_history(self):
+        tracker = SquareTracker(max_misses=1, max_grace=1, capacity=1)
+        for _ in range(5):
+            tracker.update([self.detection(920, 620)])
+        tracker.update([])
+        tracker.update([])  # Evicted; its slot is free again
+        self.assertEqual(tracker.removed, ['square_1'])
+
+        tracker.update([self.detection(400, 100)])
+        self.assertEqual(tracker.get('square_2').center, (430, 130))
+        stable = tracker.update([self.detection(401, 100)])
+        self.assertEqual([sq['id'] for sq in stable], ['square_2'])
+
+    def test_stable_tracks_survive_short_occlusions_then_expire(self):
+        tracker = SquareTracker(max_misses=2)
+        tracker.update([self.detection(100, 100)])
+        tracker.update([self.detection(101, 100)])
+        self.assertEqual(len(tracker.update([])), 1)
+        tracker.update([])
+        self.assertEqual(tracker.update([]), [])
+        self.assertEqual(tracker.removed, ['square_1'])
+
+    def test_slots_grow_and_views_read_live_state(self):
+        tracker = SquareTracker(capacity=2)
+        grid = [self.detection(100 * i, 100) for i in range(5)]
+        tracker.update([dict(d) for d in grid])
+        stable = tracker.update([dict(d) for d in grid])
+        self.assertEqual(len(stable), 5)
+        self.assertGreaterEqual(len(tracker.active), 5)
+
+        view = tracker.get('square_1')
+        tracker.update([self.detection(10, 100)] + [dict(d) for d in grid[1:]])
+        self.assertEqual(view.bbox, (5, 100, 60, 60))  # smoothed halfway
+        self.assertEqual(view['center'], (33, 130))    # mean of the center history
+
+    def test_jittering_board_keeps_ids_and_notes(self):
+        detector = SquareDetector(audio_sink=NullSink(), incremental=False)
+        ids = set()
+        for i in range(20):
+            # Square edges jitter across x = 100, 200, ...
+            _, squares, _, _ = detector.process_frame(np.roll(draw_board(), 19 + (i % 3) * 2, axis=1))
+            ids.update(sq['id'] for sq in squares)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(detector.stats.counters['scale_assignments'], 1)
+
+
+class NoteLayoutTests(SimpleTestCase):
+    def test_notes_follow_reading_order_and_shift_on_layout_changes(self):
+        layout = NoteLayout(['C', 'D', 'E'])
+        layout.add('b', (300, 50))
+        layout.add('a', (100, 60))
+        layout.add('c', (50, 250))  # second row
+        self.assertEqual([layout.note_for(i) for i in 'abc'], ['C', 'D', 'E'])
+
+        layout.remove('a')
+        self.assertEqual((layout.note_for('b'), layout.note_for('c'), layout.note_for('a')), ('C', 'D', 'C'))
+
+        layout.set_notes(['G', 'A'])
+        self.assertEqual(layout.ordered_ids(), ['b', 'c'])
+        self.assertEqual(dict(layout.assignments), {'b': 'G', 'c': 'A'})
+
+    def test_steady_frames_do_no_assignment_work(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        for _ in range(10):
+            detector.process_frame(draw_board())
+        version = detector.note_layout.version
+        for _ in range(10):
+            detector.process_frame(draw_board())
+        self.assertEqual(detector.note_layout.version, version)
+        self.assertEqual(sorted(detector.square_note_assignments.values()), ['C', 'D', 'E', 'F', 'G'])
+
+    def test_dropped_tentative_tracks_are_not_remaps(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        detector.assign_notes_to_squares([{'id': 'a', 'center': (100, 50)}], [])
+        version = detector.note_layout.version
+
+        self.assertFalse(detector.assign_notes_to_squares([], ['never_stable']))
+        self.assertEqual(detector.note_layout.version, version)
+        self.assertEqual(detector.stats.counters['scale_assignments'], 1)
+
+
+class OverlayLayerTests(SimpleTestCase):
+    def test_layer_is_composited_only_where_drawn(self):
+        layer = OverlayLayer()
+        layer.begin('k', (100, 200, 3))
+        layer.rectangle((20, 20), (60, 60), (0, 255, 0), 2)
+        layer.text("C", (100, 50), 0.6, (255, 255, 255), 2)
+
+        image = layer.composite(np.full((100, 200, 3), 9, dtype=np.uint8))
+        self.assertEqual(image[20, 40].tolist(), [0, 255, 0])
+        self.assertEqual(image[40, 40].tolist(), [9, 9, 9])  # inside the outline
+        self.assertTrue((image[35:55, 100:120] == 255).any())
+        self.assertTrue(layer.is_current('k'))
+
+    def test_static_layer_is_rebuilt_only_on_changes(self):
+        detector = SquareDetector(audio_sink=NullSink(), incremental=False)
+        for _ in range(12):
+            detector.process_frame(draw_board())
+        rebuilds = detector.overlay.rebuilds
+
+        detector.process_frame(draw_board())
+        self.assertEqual(detector.overlay.rebuilds, rebuilds)
+        detector.set_custom_scale('pentatonic')
+        detector.process_frame(draw_board())
+        self.assertEqual(detector.overlay.rebuilds, rebuilds + 1)
+
+
+    def test_camera_jitter_reuses_the_layer(self):
+        detector = SquareDetector(audio_sink=NullSink(), incremental=False)
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            detector.process_frame(np.roll(draw_board(), tuple(rng.integers(-1, 2, 2)), axis=(0, 1)))
+        self.assertEqual(len(detector.note_layout), 5)
+        hit_rate = 1 - detector.overlay.rebuilds / detector.stats.frames
+        self.assertGreaterEqual(hit_rate, 0.95)
+
+        frame = draw_board()
+        rebuilds = detector.overlay.rebuilds
+        for _ in range(3):
+            detector.process_frame(np.roll(frame, 12, axis=1))  # The board really moved
+        self.assertGreater(detector.overlay.rebuilds, rebuilds)
+
+class FrameIngestViewTests(SimpleTestCase):
+    def jpeg(self, frame):
+        return cv2.imencode('.jpg', frame)[1].tobytes()
+
+    def test_multipart_batch_is_analyzed_in_timestamp_order(self):
+        frames = [SimpleUploadedFile(f'{i}.jpg', self.jpeg(draw_board()), 'image/jpeg') for i in range(5)]
+        response = self.client.post('/api/ingest-frames/', {
+            'frame': frames, 'timestamp': ['5', '4', '3', '2', '1'],
+        }, headers={'X-Session-Id': 'ingest-batch'})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['frames']
+        self.assertEqual([r['timestamp'] for r in results], [1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(sorted(sq['note'] for sq in results[-1]['squares']), ['C', 'D', 'E', 'F', 'G'])
+
+    def test_raw_body_and_legacy_base64_endpoint(self):
+        body = self.jpeg(draw_board())
+        response = self.client.post('/api/ingest-frames/?session=raw&timestamp=12.5', body, content_type='image/jpeg')
+        self.assertEqual(response.json()['frames'][0]['timestamp'], 12.5)
+        self.assertEqual(self.client.post('/api/ingest-frames/', b'', content_type='image/jpeg').status_code, 400)
+
+        data_url = 'data:image/jpeg;base64,' + base64.b64encode(body).decode()
+        response = self.client.post('/api/detect-squares/?session=legacy', {'image': data_url}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+
+
+class FrameSocketTests(SimpleTestCase):
+    async def test_frames_are_answered_with_layout_on_the_same_connection(self):
+        from asgiref.testing import ApplicationCommunicator
+        from backend.asgi import application
+
+        jpeg = cv2.imencode('.jpg', draw_board())[1].tobytes()
+        socket = ApplicationCommunicator(application, {
+            'type': 'websocket', 'path': '/ws/frames/', 'query_string': b'session=socket-test'})
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await socket.receive_output(5))['type'], 'websocket.accept')
+        self.assertEqual(json.loads((await socket.receive_output(5))['text'])['type'], 'ready')
+
+        for _ in range(5):
+            await socket.send_input({'type': 'websocket.receive', 'bytes': jpeg})
+            message = json.loads((await socket.receive_output(5))['text'])
+        self.assertEqual(message['type'], 'frame')
+        self.assertEqual(sorted(sq['note'] for sq in message['squares']), ['C', 'D', 'E', 'F', 'G'])
+
+        await socket.send_input({'type': 'websocket.receive', 'text': '{"type": "stats"}'})
+        self.assertEqual(json.loads((await socket.receive_output(5))['text'])['processed'], 5)
+        await socket.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await socket.wait(5)
+
+    async def test_unknown_path_is_closed(self):
+        from asgiref.testing import ApplicationCommunicator
+        from backend.asgi import application
+
+        socket = ApplicationCommunicator(application, {'type': 'websocket', 'path': '/ws/nope/'})
+        await socket.send_input({'type': 'websocket.connect'})
+        self.assertEqual(await socket.receive_output(5), {'type': 'websocket.close', 'code': 4404})
+
+
+class ShardedExecutorTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = ShardedExecutor(workers=2, max_queue=8, frame_bytes=640 * 480 * 3)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_session_runs_in_one_worker_that_restarts_after_a_crash(self):
+        frames = [draw_board() for _ in range(5)] + [draw_board(touched=2)]
+        futures = [self.executor.analyze('board-a', 'piano', frame, i) for i, frame in enumerate(frames)]
+        results = [future.result(60) for future in futures]
+        self.assertEqual(sorted(sq['note'] for sq in results[4]['squares']), ['C', 'D', 'E', 'F', 'G'])
+        self.assertEqual(len(results[5]['touches']), 1)
+
+        shard = self.executor.shard('board-a')
+        self.assertEqual(shard.stats()['completed'], 6)
+        self.assertEqual(shard.stats()['sessions'], 1)
+        self.assertEqual(self.executor.stats()['queue_depth'], 0)
+
+        shard.process.kill()
+        shard.process.join(5)
+        result = self.executor.analyze('board-a', 'piano', frames[0], 7).result(60)
+        self.assertEqual(result['squares'], [])  # The session started over in the new worker
+        self.assertEqual(shard.stats()['restarts'], 1)
+        self.assertTrue(shard.stats()['alive'])
+
+    def test_routing_is_stable_and_full_queues_reject(self):
+        self.assertEqual(self.executor.shard_index('board-a'), ShardedExecutor(workers=2).shard_index('board-a'))
+        shard = self.executor.shard('board-b')
+        gate = shard.submit('open', 'board-b', 'piano')
+        with self.assertRaises(ShardOverloaded):
+            for i in range(20):
+                shard.submit('analyze', 'board-b', 'piano', i, draw_board())
+        gate.result(60)
+        self.assertGreater(shard.stats()['rejected'], 0)
+
+    def test_request_that_times_out_in_the_queue_is_dropped_not_run_late(self):
+        shard = self.executor.shard('board-c')
+        opening = shard.submit('open', 'board-c', 'piano')  # Spawns the worker, which takes a while
+        late = shard.submit('analyze', 'board-c', 'piano', 1.0, draw_board())
+        self.executor.timeout = 0.05
+        with self.assertRaises(ShardOverloaded):
+            self.executor.wait(late)
+
+        self.executor.timeout = 30
+        opening.result(60)
+        self.assertIn('board-c', self.executor.call('stats', 'board-c')['sessions'])
+        self.assertEqual((shard.stats()['completed'], shard.stats()['failed']), (2, 0))
+        self.assertTrue(late.cancelled())
+
+
+class FakeCamera:
+    """Capture stand-in that serves ``count`` frames, optionally waiting for a gate before each one"""
+
+    def __init__(self, count, gate=None):
+        self.count = count
+        self.gate = gate
+        self.released = False
+
+    def read(self):
+        if self.gate is not None:
+            self.gate.acquire(timeout=5)
+        if self.count <= 0:
+            return False, None
+        self.count -= 1
+        return True, draw_board()
+
+    def release(self):
+        self.released = True
+
+
+class FrameBroadcasterTests(SimpleTestCase):
+    def test_frames_are_processed_and_encoded_once_for_all_viewers(self):
+        gate = threading.Semaphore(0)
+        camera = FakeCamera(6, gate)
+        detector = SquareDetector(audio_sink=NullSink())
+        broadcaster = FrameBroadcaster('default', lambda: detector, lambda: camera, max_queue=2)
+        fast, other, slow = (broadcaster.subscribe() for _ in range(3))
+
+        received = []
+        for _ in range(6):
+            gate.release()
+            received.append((fast.get(timeout=5), other.get(timeout=5)))
+        gate.release()  # end of stream
+
+        self.assertTrue(all(a is b for a, b in received))
+        self.assertEqual(detector.frame_count, 6)
+        self.assertEqual(broadcaster.encoded['overlay'], 6)
+        self.assertEqual(broadcaster.encoded['threshold'], 0)
+        self.assertEqual((slow.dropped, slow.depth), (4, 2))
+
+        self.assertIsNone(fast.get(timeout=5))
+        self.assertTrue(fast.closed and camera.released)
+
+
+    def test_viewer_joining_during_shutdown_is_served_by_a_new_loop(self):
+        releasing, resume = threading.Event(), threading.Event()
+        ending = FakeCamera(1)
+
+        def release():
+            releasing.set()
+            resume.wait(5)
+
+        ending.release = release
+        cameras = iter([ending, FakeCamera(3)])
+        broadcaster = FrameBroadcaster('default', lambda: SquareDetector(audio_sink=NullSink()), lambda: next(cameras))
+        viewer = broadcaster.subscribe()
+
+        self.assertTrue(releasing.wait(5))
+        late = broadcaster.subscribe()
+        resume.set()
+
+        self.assertIsNotNone(late.get(timeout=5))
+        while late.get(timeout=5) is not None:
+            pass  # Let the new loop run to the end of its camera
+        self.assertTrue(late.closed and viewer.closed)
+
+class StagedPipelineTests(SimpleTestCase):
+    def test_latest_slot_keeps_only_the_newest_item(self):
+        slot = LatestSlot()
+        for item in (1, 2, 3):
+            slot.put(item)
+        self.assertEqual((slot.get(timeout=0), slot.overwritten), (3, 2))
+        slot.close()
+        self.assertIsNone(slot.get())
+
+    def test_render_stage_draws_from_a_detached_analysis(self):
+        detector = SquareDetector(audio_sink=NullSink())
+        for _ in range(4):
+            analysis = detector.analyze_frame(draw_board())
+        self.assertEqual(len(analysis.stable_squares), 5)
+
+        # The detector moves on before the earlier analysis is rendered
+        detector.analyze_frame(np.full((480, 640, 3), 220, dtype=np.uint8))
+        image = detector.render_frame(analysis)
+        x, y, w, h = analysis.stable_squares[0]['bbox']
+        self.assertTrue((image[y - 3:y + 4, x:x + w] == (0, 255, 0)).all(axis=-1).any())
+        self.assertEqual(analysis.notes[analysis.stable_squares[0]['id']], detector.get_note_for_square(analysis.stable_squares[0]['id']))
+
+
+class CaptureServiceTests(SimpleTestCase):
+    def test_one_device_read_is_shared_and_released_when_idle(self):
+        gate = threading.Semaphore(0)
+        cameras = []
+        service = CaptureService(0, lambda device: cameras.append(FakeCamera(10, gate)) or cameras[-1])
+        first, second = service.subscribe(), service.subscribe()
+
+        gate.release()
+        ok, frame = first.read()
+        self.assertTrue(ok)
+        self.assertIs(second.read()[1], frame)
+        self.assertFalse(frame.flags.writeable)
+
+        for _ in range(3):
+            gate.release()
+        while service.frames_read < 4:
+            time.sleep(0.01)
+        self.assertTrue(first.read()[0])
+        self.assertEqual(first.dropped, 2)  # only the newest frame is handed out
+
+        first.release()
+        second.release()
+        gate.release()
+        while service.stats()['running']:
+            time.sleep(0.01)
+        self.assertEqual(len(cameras), 1)
+        self.assertTrue(cameras[0].released)
+
+
+class NoteEventBusTests(SimpleTestCase):
+    def test_detector_notes_reach_session_subscribers(self):
+        bus = NoteEventBus()
+        piano = bus.subscribe('piano')
+        drums = bus.subscribe('drums')
+        detector = SquareDetector(audio_sink=NullSink(), event_channel=lambda e: bus.publish('piano', e))
+        detector.square_note_assignments['sq'] = 'G'
+
+        detector.play_instrument_note('sq', timestamp=123.0)
+
+        event = piano.get(timeout=1)
+        self.assertEqual((event['note'], event['square_id'], event['captured_at']), ('G', 'sq', 123.0))
+        self.assertIsNone(drums.get(timeout=0))
+
+    def test_slow_subscriber_drops_oldest_events(self):
+        bus = NoteEventBus(max_queue=2)
+        subscription = bus.subscribe('s')
+        for note in ('C', 'D', 'E'):
+            bus.publish('s', {'type': 'note', 'note': note})
+
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(subscription.get(timeout=0)['note'], 'D')
+        subscription.close()
+        self.assertEqual(bus.subscriber_count(), 0)
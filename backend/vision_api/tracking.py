@@ -0,0 +1,257 @@
+"""
+Frame-to-frame tracking of detected squares.
+
+``SquareTracker`` associates each frame's detections with existing tracks by
+center distance (normalised by the track's size) using greedy minimum-cost
+matching, and keeps a persistent id, a smoothed position and hit/miss counts
+per track. Stable tracks ride out occlusions (a hand resting on a square) for
+longer the longer they have been seen, so their notes stay put.
+
+Track state is stored struct-of-arrays: preallocated NumPy arrays indexed by
+slot for bboxes, counters and a fixed-length ring of recent centers, so a
+frame's update is a handful of vectorized operations. Detections' contours
+are not retained. Callers see each track through a ``TrackView``, a small
+``__slots__`` object created once per track that reads the arrays live and
+supports ``square['bbox']``-style access like the detection dicts.
+"""
+
+import itertools
+
+import numpy as np
+
+SLOT_ARRAYS = ('active', 'stable', 'bboxes', 'centers', 'areas', 'hits', 'misses', 'first_seen',
+               'ring', 'ring_pos', 'ring_len')
+
+TRACK_FIELDS = ('id', 'center', 'bbox', 'area', 'aspect_ratio', 'hits', 'misses', 'stable', 'first_seen_frame')
+
+
+class TrackView:
+    """Live, read-only view of one tracker slot"""
+
+    __slots__ = ('_tracker', 'slot', 'id')
+
+    def __init__(self, tracker, slot, track_id):
+        self._tracker = tracker
+        self.slot = slot
+        self.id = track_id
+
+    @property
+    def bbox(self):
+        return tuple(int(v) for v in np.rint(self._tracker.bboxes[self.slot]))
+
+    @property
+    def center(self):
+        cx, cy = np.rint(self._tracker.centers[self.slot])
+        return (int(cx), int(cy))
+
+    @property
+    def area(self):
+        return float(self._tracker.areas[self.slot])
+
+    @property
+    def aspect_ratio(self):
+        _, _, w, h = self._tracker.bboxes[self.slot]
+        return float(w / h) if h else 0.0
+
+    @property
+    def hits(self):
+        return int(self._tracker.hits[self.slot])
+
+    @property
+    def misses(self):
+        return int(self._tracker.misses[self.slot])
+
+    @property
+    def stable(self):
+        return bool(self._tracker.stable[self.slot])
+
+    @property
+    def first_seen_frame(self):
+        return int(self._tracker.first_seen[self.slot])
+
+    def __getitem__(self, key):
+        if key not in TRACK_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in TRACK_FIELDS else default
+
+    def copy(self):
+        """Snapshot as a plain dict"""
+        return {key: getattr(self, key) for key in TRACK_FIELDS}
+
+    def __repr__(self):
+        return f"TrackView({self.id!r}, bbox={self.bbox})"
+
+
+class SquareTracker:
+    """Associates detections with persistent tracks across frames"""
+
+    def __init__(self, max_distance=0.5, min_hits=2, max_misses=5, max_grace=30, smoothing=0.5, history=5,
+                 capacity=32, prefix='square'):
+        # A detection may match a track whose center is within max_distance x track size
+        self.max_distance = max_distance
+        self.min_hits = min_hits
+        # A stable track may miss max_misses frames, or one per frame it was seen, up to max_grace
+        self.max_misses = max_misses
+        self.max_grace = max_grace
+        self.smoothing = smoothing
+        self.history = history
+        self.prefix = prefix
+        self.removed = []
+        self.promoted = []
+        self._ids = itertools.count(1)
+        self._slots = {}
+        self._views = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        """(Re)size the slot arrays, keeping existing tracks"""
+        old = getattr(self, 'active', np.zeros(0, dtype=bool))
+        n = len(old)
+
+        def grow(name, shape, dtype):
+            array = np.zeros((capacity,) + shape, dtype=dtype)
+            if n:
+                array[:n] = getattr(self, name)
+            setattr(self, name, array)
+
+        grow('active', (), bool)
+        grow('stable', (), bool)
+        grow('bboxes', (4,), np.float64)
+        grow('centers', (2,), np.float64)
+        grow('areas', (), np.float64)
+        grow('hits', (), np.int32)
+        grow('misses', (), np.int32)
+        grow('first_seen', (), np.int64)
+        grow('ring', (self.history, 2), np.float64)
+        grow('ring_pos', (), np.int32)
+        grow('ring_len', (), np.int32)
+        self._views.extend([None] * (capacity - n))
+
+    def __len__(self):
+        return len(self._slots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in SLOT_ARRAYS)
+
+    def __contains__(self, track_id):
+        return track_id in self._slots
+
+    def get(self, track_id):
+        slot = self._slots.get(track_id)
+        return self._views[slot] if slot is not None else None
+
+    def match(self, slots, detections):
+        """Greedy minimum-cost pairs of (slot index, detection index) under the distance gate"""
+        if not len(slots) or not detections:
+            return []
+        det_centers = np.array([square['center'] for square in detections], dtype=np.float64)
+        sizes = np.maximum(self.bboxes[slots, 2:].max(axis=1), 1.0)
+
+        cost = np.linalg.norm(self.centers[slots, None, :] - det_centers[None, :, :], axis=2) / sizes[:, None]
+        pairs, used_tracks, used_dets = [], set(), set()
+        for flat in np.argsort(cost, axis=None):
+            t, d = divmod(int(flat), len(detections))
+            if cost[t, d] > self.max_distance:
+                break
+            if t in used_tracks or d in used_dets:
+                continue
+            used_tracks.add(t)
+            used_dets.add(d)
+            pairs.append((t, d))
+        return pairs
+
+    def update(self, detections, frame_index=0):
+        """Fold one frame's detections into the tracks.
+
+        Matched detections are stamped with their track id. Returns views of
+        the stable tracks; tracks that became stable this frame are left in
+        ``promoted`` and ids of tracks dropped this frame in ``removed``.
+        """
+        self.promoted = []
+        slots = np.flatnonzero(self.active)
+        pairs = self.match(slots, detections)
+
+        matched = np.zeros(len(self.active), dtype=bool)
+        if pairs:
+            t_idx, d_idx = map(list, zip(*pairs))
+            matched_slots = slots[t_idx]
+            boxes = np.array([detections[d]['bbox'] for d in d_idx], dtype=np.float64)
+            self.bboxes[matched_slots] += self.smoothing * (boxes - self.bboxes[matched_slots])
+            self.areas[matched_slots] = [detections[d]['area'] for d in d_idx]
+            self._push_centers(matched_slots, np.array([detections[d]['center'] for d in d_idx], dtype=np.float64))
+            self.hits[matched_slots] += 1
+            self.misses[matched_slots] = 0
+            promote = ~self.stable[matched_slots] & (self.hits[matched_slots] >= self.min_hits)
+            self.stable[matched_slots[promote]] = True
+            self.promoted = [self._views[slot] for slot in matched_slots[promote].tolist()]
+            matched[matched_slots] = True
+            for slot, d in zip(matched_slots.tolist(), d_idx):
+                detections[d]['id'] = self._views[slot].id
+
+        # Tentative tracks go at once; stable ones ride out short occlusions
+        missed = self.active & ~matched
+        self.misses[missed] += 1
+        grace = np.clip(self.hits, self.max_misses, max(self.max_grace, self.max_misses))
+        expired = missed & (~self.stable | (self.misses > grace))
+        self.removed = [self._release(slot) for slot in np.flatnonzero(expired).tolist()]
+
+        matched_dets = {d for _, d in pairs}
+        for d, square in enumerate(detections):
+            if d not in matched_dets:
+                square['id'] = self._start(square, frame_index)
+
+        return self.stable_squares()
+
+    def _push_centers(self, slots, centers):
+        """Write new centers into each slot's history ring and re-average it"""
+        self.ring[slots, self.ring_pos[slots]] = centers
+        self.ring_pos[slots] = (self.ring_pos[slots] + 1) % self.history
+        self.ring_len[slots] = np.minimum(self.ring_len[slots] + 1, self.history)
+        self.centers[slots] = self.ring[slots].sum(axis=1) / self.ring_len[slots, None]
+
+    def _start(self, square, frame_index):
+        free = np.flatnonzero(~self.active)
+        if not len(free):
+            self._allocate(len(self.active) * 2)
+            free = np.flatnonzero(~self.active)
+        slot = int(free[0])
+        track_id = f"{self.prefix}_{next(self._ids)}"
+
+        self.active[slot] = True
+        self.stable[slot] = self.min_hits <= 1
+        self.bboxes[slot] = square['bbox']
+        self.areas[slot] = square['area']
+        self.hits[slot] = 1
+        self.misses[slot] = 0
+        self.first_seen[slot] = frame_index
+        self.ring[slot] = 0  # A reused slot must not average in the previous track's centers
+        self.ring_pos[slot] = self.ring_len[slot] = 0
+        self._push_centers(np.array([slot]), np.array([square['center']], dtype=np.float64))
+
+        self._slots[track_id] = slot
+        self._views[slot] = TrackView(self, slot, track_id)
+        if self.stable[slot]:
+            self.promoted.append(self._views[slot])
+        return track_id
+
+    def _release(self, slot):
+        view = self._views[slot]
+        self.active[slot] = False
+        self._views[slot] = None
+        del self._slots[view.id]
+        return view.id
+
+    def stable_squares(self):
+        return [self._views[slot] for slot in np.flatnonzero(self.active & self.stable).tolist()]
+
+    def active_squares(self):
+        """Every live track, tentative ones included"""
+        return [self._views[slot] for slot in np.flatnonzero(self.active).tolist()]
+
+    def clear(self):
+        self.promoted = []
+        self.removed = [self._release(slot) for slot in np.flatnonzero(self.active).tolist()]
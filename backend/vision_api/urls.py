@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import VideoStreamView, SquareDetectionView, InstrumentConfigView, ParsePdfNotesView, GenerateLessonView, WrongNoteHandlerView, DemoModeView, ProgressTrackingView, ThresholdDebugView, ParsePdfNotesView, PdfImageView, AutoParsePdfView, PianoStreamView, DrumStreamView, FluteStreamView
+from .views import VideoStreamView, SquareDetectionView, InstrumentConfigView, ParsePdfNotesView, GenerateLessonView, WrongNoteHandlerView, DemoModeView, ProgressTrackingView, ThresholdDebugView, ParsePdfNotesView, PdfImageView, AutoParsePdfView, PianoStreamView, DrumStreamView, FluteStreamView, NoteEventStreamView, DetectorStatsView, StreamStatsView, CaptureStatsView, SessionStatsView, WorkerStatsView, FrameIngestView
 
 app_name = 'visionapi'
 
@@ -7,6 +7,7 @@ urlpatterns = [
     # Original endpoints
     path('video-stream/', VideoStreamView.as_view(), name='video-stream'),
     path('detect-squares/', SquareDetectionView.as_view(), name='detect-squares'),
+    path('ingest-frames/', FrameIngestView.as_view(), name='ingest-frames'),
     path('instrument-config/', InstrumentConfigView.as_view(), name='instrument-config'),
     path('generate-lesson/', GenerateLessonView.as_view(), name='generate-lesson'),
     path('wrong-note/', WrongNoteHandlerView.as_view(), name='wrong-note'),
@@ -19,4 +20,10 @@ urlpatterns = [
     path('piano-stream/', PianoStreamView.as_view(), name='piano-stream'),
     path('drum-stream/', DrumStreamView.as_view(), name='drum-stream'),
     path('flute-stream/', FluteStreamView.as_view(), name='flute-stream'),
+    path('note-events/', NoteEventStreamView.as_view(), name='note-events'),
+    path('detector-stats/', DetectorStatsView.as_view(), name='detector-stats'),
+    path('stream-stats/', StreamStatsView.as_view(), name='stream-stats'),
+    path('capture-stats/', CaptureStatsView.as_view(), name='capture-stats'),
+    path('sessions/', SessionStatsView.as_view(), name='sessions'),
+    path('workers/', WorkerStatsView.as_view(), name='workers'),
 ]
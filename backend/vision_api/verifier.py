@@ -0,0 +1,132 @@
+"""
+Optional learned verification of square candidates.
+
+Square acceptance is decided by the area, aspect-ratio and corner-count gates
+in ``evaluate_contour``. ``backend/square_classifier.h5`` is a small Keras CNN
+(32x32 grayscale patch -> not-square/square softmax) that can veto candidates
+those gates let through. ``SquareVerifier`` crops a patch around each
+candidate and classifies all of a frame's new candidates in one batched call
+on the CPU. Detectors call it only for tracks they have not classified yet and
+cache the verdict per track id, so a square costs one classification for its
+lifetime rather than one per frame.
+
+The verifier is off unless ``LEADZEPPELIN_SQUARE_VERIFIER`` is set. The model
+is loaded on first use, or ahead of traffic with ``warm_up()`` (also run by
+``registry.warm_up()`` and the ``warm_detectors`` command). TensorFlow is an
+optional dependency: if it is missing or the model cannot be loaded, every
+candidate is accepted and detection behaves exactly as without the verifier.
+"""
+
+import logging
+import os
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent.parent / 'square_classifier.h5'
+PATCH_SIZE = 32
+
+
+def load_keras_model(path):
+    """Batch -> class probabilities callable for the Keras model at ``path``, or None without TensorFlow"""
+    try:
+        import tensorflow as tf
+    except ImportError:
+        logger.warning("TensorFlow is not installed; square verification is disabled")
+        return None
+    try:
+        tf.config.set_visible_devices([], 'GPU')  # CPU only
+    except RuntimeError:
+        pass  # Devices were already initialized by someone else
+    model = tf.keras.models.load_model(path, compile=False)
+    # Calling the model directly avoids predict()'s per-call setup cost for small batches
+    return lambda batch: model(batch, training=False).numpy()
+
+
+class SquareVerifier:
+    """Lazily loaded CNN that accepts or rejects square candidates in batches"""
+
+    def __init__(self, model_path=None, threshold=None, square_class=None, enabled=None, loader=load_keras_model):
+        self.model_path = Path(model_path or os.getenv('LEADZEPPELIN_SQUARE_MODEL', DEFAULT_MODEL_PATH))
+        self.threshold = threshold if threshold is not None else float(os.getenv('LEADZEPPELIN_SQUARE_THRESHOLD', '0.5'))
+        self.square_class = square_class if square_class is not None else int(os.getenv('LEADZEPPELIN_SQUARE_CLASS', '1'))
+        self.enabled = enabled if enabled is not None else os.getenv('LEADZEPPELIN_SQUARE_VERIFIER', '') not in ('', '0')
+        self.loader = loader
+        self.batches = 0
+        self.classified = 0
+        self.rejected = 0
+        self._model = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    @property
+    def available(self):
+        """Model loaded and usable (False before the first load)"""
+        return self._model is not None
+
+    def load(self):
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    try:
+                        self._model = self.loader(self.model_path)
+                    except Exception:
+                        logger.exception("Could not load square classifier from %s", self.model_path)
+                    self._loaded = True
+                    if self._model is not None:
+                        logger.info("Loaded square classifier from %s", self.model_path)
+        return self._model
+
+    def warm_up(self):
+        """Load the model and run one dummy batch so the first real frame pays neither cost"""
+        model = self.load()
+        if model is not None:
+            with self._run_lock:
+                model(np.zeros((1, PATCH_SIZE, PATCH_SIZE, 1), dtype=np.float32))
+        return model is not None
+
+    def patches(self, gray, bboxes, margin=0.1):
+        """(N, 32, 32, 1) float32 batch of the candidates' neighbourhoods, scaled to [0, 1]"""
+        height, width = gray.shape[:2]
+        batch = np.empty((len(bboxes), PATCH_SIZE, PATCH_SIZE, 1), dtype=np.float32)
+        for i, (x, y, w, h) in enumerate(bboxes):
+            mx, my = int(w * margin), int(h * margin)
+            x0, y0 = max(x - mx, 0), max(y - my, 0)
+            x1, y1 = min(x + w + mx, width), min(y + h + my, height)
+            patch = cv2.resize(gray[y0:y1, x0:x1], (PATCH_SIZE, PATCH_SIZE), interpolation=cv2.INTER_AREA)
+            batch[i, :, :, 0] = patch
+        batch /= 255.0
+        return batch
+
+    def verify(self, gray, bboxes):
+        """Accept/reject verdict per bbox from a single inference call; all accepted without a model"""
+        if not bboxes:
+            return []
+        model = self.load()
+        if model is None:
+            return [True] * len(bboxes)
+        batch = self.patches(gray, bboxes)
+        with self._run_lock:
+            scores = model(batch)[:, self.square_class]
+        verdicts = (scores >= self.threshold).tolist()
+        self.batches += 1
+        self.classified += len(verdicts)
+        self.rejected += verdicts.count(False)
+        return verdicts
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'available': self.available,
+            'batches': self.batches,
+            'classified': self.classified,
+            'rejected': self.rejected,
+        }
+
+
+square_verifier = SquareVerifier()
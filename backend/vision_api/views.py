@@ -8,15 +8,26 @@ from .gemini_integration import map_notes_to_shapes, generate_lesson_plan, gener
 import io
 import cv2
 import json
+import time
 import base64
 import numpy as np
-from .cv_processor import SquareDetector
-
-# Global detector instance
-piano_detector = SquareDetector(instrument_type="piano")
-drum_detector = SquareDetector(instrument_type="drums") 
-flute_detector = SquareDetector(instrument_type="flute")
-detector = SquareDetector()
+from .broadcast import broadcasters
+from .capture import captures
+from .registry import detectors, sessions
+from .events import note_events, format_sse
+from .frame_context import decode_image
+from .workers import ShardOverloaded, WorkerError, executor, open_session
+
+def session_key(request):
+    """Client session for per-user detector state: ?session=, X-Session-Id, else the Django session cookie"""
+    key = request.query_params.get('session') or request.headers.get('X-Session-Id')
+    if key:
+        return key
+    if request.session.session_key is None:
+        # Issue a session now; SessionMiddleware sends its cookie with this response
+        request.session.modified = True
+        request.session.save()
+    return f"web-{request.session.session_key}"
 
 class PianoStreamView(APIView):
     """Piano-specific video stream"""
@@ -27,20 +38,8 @@ class PianoStreamView(APIView):
         )
     
     def generate_piano_frames(self):
-        cap = cv2.VideoCapture(0)
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            processed_frame, squares, touches, thresh_debug = piano_detector.process_frame(frame)
-            
-            # Convert frame to JPEG
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        # One shared process/encode loop per detector, whatever the viewer count
+        return broadcasters.get('piano').stream()
 
 
 class DrumStreamView(APIView):
@@ -52,20 +51,7 @@ class DrumStreamView(APIView):
         )
     
     def generate_drum_frames(self):
-        cap = cv2.VideoCapture(0)
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            processed_frame, squares, touches, thresh_debug = drum_detector.process_frame(frame)
-            
-            # Convert frame to JPEG
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        return broadcasters.get('drums').stream()
 
 class FluteStreamView(APIView):
     """Flute-specific video stream"""
@@ -76,20 +62,74 @@ class FluteStreamView(APIView):
         )
     
     def generate_flute_frames(self):
-        cap = cv2.VideoCapture(0)
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            processed_frame, squares, touches, thresh_debug = flute_detector.process_frame(frame)
-            
-            # Convert frame to JPEG
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        return broadcasters.get('flute').stream()
+
+class NoteEventStreamView(APIView):
+    """Server-Sent Events stream of note events for one session (?session=, else the caller's own session)"""
+    keepalive_seconds = 15
+    
+    def get(self, request):
+        session_id = request.query_params.get('session') or session_key(request)
+        response = StreamingHttpResponse(
+            self.generate_events(note_events.subscribe(session_id)),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    def generate_events(self, subscription):
+        try:
+            yield b'retry: 1000\n\n'
+            while True:
+                event = subscription.get(timeout=self.keepalive_seconds)
+                if event is None:
+                    yield b': keepalive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            subscription.close()
+
+class DetectorStatsView(APIView):
+    """Per-stage timings and detection counters for every detector built in this process"""
+    def get(self, request):
+        return Response(detectors.stats(), status=status.HTTP_200_OK)
+
+class StreamStatsView(APIView):
+    """Frames processed, frames encoded and per-viewer queue metrics for every video stream"""
+    def get(self, request):
+        return Response(broadcasters.stats(), status=status.HTTP_200_OK)
+
+class SessionStatsView(APIView):
+    """Active per-session detectors, their memory and eviction counters (per worker when workers are enabled)"""
+    def get(self, request):
+        stats = sessions.stats()
+        if executor.enabled:
+            stats['workers'] = executor.session_stats()
+        return Response(stats, status=status.HTTP_200_OK)
+    
+    def delete(self, request):
+        """End the caller's session and free its detector"""
+        key = session_key(request)
+        released = sessions.release(key)
+        if executor.enabled:
+            try:
+                released = executor.call('release', key) or released
+            except ShardOverloaded as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except WorkerError as e:
+                return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response({'released': released}, status=status.HTTP_200_OK)
+
+class WorkerStatsView(APIView):
+    """Health, queue depth and service time of every worker shard"""
+    def get(self, request):
+        return Response(executor.stats(), status=status.HTTP_200_OK)
+
+class CaptureStatsView(APIView):
+    """Capture fps, frames read and dropped-frame counters for every shared camera"""
+    def get(self, request):
+        return Response(captures.stats(), status=status.HTTP_200_OK)
 
 class VideoStreamView(APIView):
     """Stream video feed with square detection"""
@@ -101,22 +141,7 @@ class VideoStreamView(APIView):
         )
     
     def generate_frames(self):
-        cap = cv2.VideoCapture(0)  # Use default camera
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Process frame for square detection
-            processed_frame, squares, occluded, thresh_debug = detector.process_frame(frame)
-            
-            # Convert frame to JPEG
-            _, buffer = cv2.imencode('.jpg', processed_frame)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+        return broadcasters.get('default').stream()
 
 class SquareDetectionView(APIView):
     """API endpoint for square detection analysis"""
@@ -132,13 +157,15 @@ class SquareDetectionView(APIView):
                 nparr = np.frombuffer(image_bytes, np.uint8)
                 frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
                 
-                # Process frame
-                processed_frame, squares, occluded = detector.process_frame(frame)
+                # Process frame with this client's own detector state
+                # Same session state as the ingest endpoint, in its worker process when enabled
+                session = open_session(session_key(request), request.data.get('instrument', 'piano'))
+                result = session.analyze(frame, time.time())
                 
                 # Prepare response data
                 response_data = {
-                    'squares_detected': len(squares),
-                    'occluded_squares': len(occluded),
+                    'squares_detected': len(result['squares']),
+                    'occluded_squares': len(result['touches']),
                     'squares': [
                         {
                             'id': square['id'],
@@ -146,9 +173,9 @@ class SquareDetectionView(APIView):
                             'area': square['area'],
                             'bbox': square['bbox']
                         }
-                        for square in squares
+                        for square in result['squares']
                     ],
-                    'sounds_played': [square['id'] for square in occluded]
+                    'sounds_played': [touch['square_id'] for touch in result['touches']]
                 }
                 
                 return Response(response_data, status=status.HTTP_200_OK)
@@ -158,12 +185,67 @@ class SquareDetectionView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
+        except ShardOverloaded as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except WorkerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
         except Exception as e:
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+class FrameIngestView(APIView):
+    """Detection and touch results for frames captured in the browser.
+    
+    Accepts a raw JPEG/WebP body (timestamp in ?timestamp= or X-Frame-Timestamp)
+    or a multipart batch of 'frame' files with matching 'timestamp' fields.
+    Frames are analyzed in timestamp order with the caller's session detector
+    (in its worker process when workers are enabled); nothing is drawn or
+    re-encoded.
+    """
+    max_batch = 32
+    
+    def post(self, request):
+        try:
+            frames = self.read_frames(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            session = open_session(session_key(request), request.query_params.get('instrument', 'piano'))
+            results = []
+            for timestamp, frame in sorted(frames, key=lambda item: item[0]):
+                if frame is None:
+                    results.append({'timestamp': timestamp, 'error': 'Could not decode frame'})
+                    continue
+                results.append(session.analyze(frame, timestamp))
+        except ShardOverloaded as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except WorkerError as e:
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        
+        return Response({'frames': results}, status=status.HTTP_200_OK)
+    
+    def read_frames(self, request):
+        """[(timestamp, frame or None)] from a raw image body or a multipart batch"""
+        now = time.time()
+        if request.content_type.startswith('multipart/'):
+            files = request.FILES.getlist('frame')
+            if not files:
+                raise ValueError("No 'frame' files in multipart body")
+            if len(files) > self.max_batch:
+                raise ValueError(f"At most {self.max_batch} frames per request")
+            timestamps = request.data.getlist('timestamp')
+            return [(float(timestamps[i]) if i < len(timestamps) else now, decode_image(f.read()))
+                    for i, f in enumerate(files)]
+        
+        body = request.body
+        if not body:
+            raise ValueError('No image data provided')
+        timestamp = request.query_params.get('timestamp') or request.headers.get('X-Frame-Timestamp')
+        return [(float(timestamp) if timestamp else now, decode_image(body))]
+
 class InstrumentConfigView(APIView):
     """Configure different instruments"""
     def post(self, request):
@@ -172,12 +254,8 @@ class InstrumentConfigView(APIView):
             scale = request.data.get('scale', 'major')
             
             # Configure the appropriate detector
-            if instrument_type == 'piano':
-                piano_detector.set_custom_scale(scale)
-            elif instrument_type == 'drums':
-                drum_detector.set_custom_scale(scale)
-            elif instrument_type == 'flute':
-                flute_detector.set_custom_scale(scale)
+            if instrument_type in ('piano', 'drums', 'flute'):
+                detectors.get(instrument_type).set_custom_scale(scale)
             
             return Response({
                 'message': f'{instrument_type.title()} configured with {scale} scale',
@@ -196,11 +274,11 @@ class InstrumentConfigView(APIView):
                 {'value': 'drums', 'label': '🥁 Drums', 'description': 'Percussion kit with kick, snare, hi-hat, toms'},
                 {'value': 'flute', 'label': '🪈 Flute', 'description': 'Woodwind with pure, breathy tones'}
             ],
-            'available_scales': ['major', 'pentatonic', 'blues', 'minor', 'fourths', 'simple'],
+            'available_scales': ['major', 'pentatonic', 'blues', 'minor', 'fourths', 'simple', 'octave', 'major_two_octaves'],
             'current_configurations': {
-                'piano': {'scale': ' '.join(piano_detector.available_notes)},
-                'drums': {'scale': ' '.join(drum_detector.available_notes)},
-                'flute': {'scale': ' '.join(flute_detector.available_notes)}
+                'piano': {'scale': ' '.join(detectors.available_notes('piano'))},
+                'drums': {'scale': ' '.join(detectors.available_notes('drums'))},
+                'flute': {'scale': ' '.join(detectors.available_notes('flute'))}
             }
         }, status=status.HTTP_200_OK)
 
@@ -505,21 +583,5 @@ class ThresholdDebugView(APIView):
         )
     
     def generate_threshold_frames(self):
-        cap = cv2.VideoCapture(0)
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            # Get threshold debug image
-            _, _, _, thresh_debug = detector.process_frame(frame)
-            
-            # Convert threshold image to 3-channel for JPEG encoding
-            thresh_color = cv2.cvtColor(thresh_debug, cv2.COLOR_GRAY2BGR)            
-            # Convert frame to JPEG
-            _, buffer = cv2.imencode('.jpg', thresh_color)
-            frame_bytes = buffer.tobytes()
-            
-            yield (b'--frame\r\n'
-                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
\ No newline at end of file
+        # Encoded from the same loop as the default video stream
+        return broadcasters.get('default').stream('threshold')
@@ -0,0 +1,144 @@
+"""
+WebSocket frame channel for browser-captured video.
+
+Clients open ``/ws/frames/?session=<id>&instrument=<name>`` and send each
+webcam frame as a binary message (JPEG/WebP bytes). The server answers on the
+same connection with a JSON message per analyzed frame: the square layout with
+its notes and the touches detected in that frame. Text messages carry control
+commands (``{"type": "scale", "scale": "blues"}``, ``{"type": "stats"}``).
+
+Each connection has its own session (a detector from the session pool, or
+its shard's worker process when workers are enabled). Frames arriving
+while the previous one is still being analyzed replace each other, so the
+server always works on the newest frame and a slow connection never builds a
+backlog; replaced frames are reported as ``dropped``.
+
+This is a plain ASGI handler routed from ``backend/asgi.py``; it does not need
+Django Channels.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from .frame_context import decode_image
+from .workers import WorkerError, open_session
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSocket:
+    """One WebSocket connection: newest-frame-wins analysis for its session"""
+
+    def __init__(self, send, session):
+        self.send = send
+        self.session = session
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.closed = False
+        self._latest = None
+        self._ready = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+
+    async def send_json(self, message):
+        async with self._send_lock:
+            await self.send({'type': 'websocket.send', 'text': json.dumps(message, separators=(',', ':'))})
+
+    async def receive_loop(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes') is not None:
+                self.received += 1
+                if self._latest is not None:
+                    self.dropped += 1  # Superseded before it was analyzed
+                self._latest = (time.time(), message['bytes'])
+                self._ready.set()
+            elif message.get('text'):
+                await self.handle_command(message['text'])
+        self.closed = True
+        self._ready.set()
+
+    async def process_loop(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if self.closed:
+                return
+            item, self._latest = self._latest, None
+            if item is None:
+                continue
+            result = await asyncio.to_thread(self.analyze, *item)
+            self.processed += 1
+            await self.send_json(result)
+
+    def analyze(self, received_at, data):
+        frame = decode_image(data)
+        if frame is None:
+            return {'type': 'error', 'error': 'Could not decode frame', 'received_at': received_at}
+        try:
+            result = self.session.analyze(frame, received_at)
+        except WorkerError as e:
+            return {'type': 'error', 'error': str(e), 'received_at': received_at}
+        result.update(type='frame', received_at=received_at, dropped=self.dropped,
+                      latency_ms=(time.time() - received_at) * 1000)
+        return result
+
+    async def handle_command(self, text):
+        try:
+            command = json.loads(text)
+        except ValueError:
+            await self.send_json({'type': 'error', 'error': 'Commands must be JSON'})
+            return
+        kind = command.get('type')
+        if kind == 'scale':
+            try:
+                ok = await asyncio.to_thread(self.session.set_scale, command.get('scale', 'major'))
+            except WorkerError as e:
+                await self.send_json({'type': 'error', 'error': str(e)})
+                return
+            await self.send_json({'type': 'scale', 'ok': ok, 'notes': self.session.notes})
+        elif kind == 'stats':
+            await self.send_json({'type': 'stats', 'received': self.received, 'processed': self.processed,
+                                  'dropped': self.dropped})
+        else:
+            await self.send_json({'type': 'error', 'error': f"Unknown command '{kind}'"})
+
+
+async def frame_socket(scope, receive, send):
+    """ASGI handler for the ``/ws/frames/`` WebSocket"""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    params = parse_qs(scope.get('query_string', b'').decode())
+    session_id = params.get('session', [None])[0] or f"ws-{uuid.uuid4().hex}"
+    instrument_type = params.get('instrument', ['piano'])[0]
+    # Building a detector may load a sound bank; keep it off the event loop
+    try:
+        session = await asyncio.to_thread(open_session, session_id, instrument_type)
+    except WorkerError as e:
+        logger.warning("Frame socket %s refused: %s", session_id, e)
+        await send({'type': 'websocket.close', 'code': 1013})  # Try again later
+        return
+    await send({'type': 'websocket.accept'})
+
+    connection = FrameSocket(send, session)
+    await connection.send_json({'type': 'ready', 'session': session_id, 'instrument': session.instrument_type,
+                                'notes': session.notes})
+    worker = asyncio.create_task(connection.process_loop())
+    try:
+        await connection.receive_loop(receive)
+    finally:
+        await worker
+        try:
+            await asyncio.to_thread(session.release)
+        except WorkerError as e:
+            logger.warning("Could not release frame socket session %s: %s", session_id, e)
+        logger.info("Frame socket %s closed: %d received, %d processed, %d dropped",
+                    session_id, connection.received, connection.processed, connection.dropped)
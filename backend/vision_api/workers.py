@@ -0,0 +1,388 @@
+"""
+Process-sharded execution of per-session detector work.
+
+Detection, tracking and touch handling are Python-level work, so in one
+process they are limited to one core however many boards are connected. With
+``LEADZEPPELIN_WORKERS`` set to N > 0, a ``ShardedExecutor`` runs N worker
+processes, each with its own ``DetectorPool``. Sessions are routed to a shard
+by a stable hash of their id, so all of a session's frames land in the same
+process and its tracks, background model and note layout stay there.
+
+Each shard has one feeder thread in the web process that takes requests from
+a bounded queue and runs them in order over a ``Pipe``. Frame pixels do not go
+through the pipe: the feeder copies them into a shared-memory buffer owned by
+the shard and only sends the shape, and the worker analyzes a view of that
+buffer in place. Only the small JSON-friendly results (and the note events the
+frame produced, which are re-published on ``note_events`` here) come back.
+
+A full shard queue rejects new work with ``ShardOverloaded`` instead of
+building a backlog, and requests that waited in the queue longer than the
+worker timeout (or whose caller gave up) are discarded rather than run late,
+so a session's tracker never sees frames out of order. A worker that dies or
+stops answering is restarted on the next request; the sessions it held start
+over. ``stats()`` reports per-shard health and queue depth.
+
+With ``LEADZEPPELIN_WORKERS`` unset (or 0) everything runs in the web
+process; ``open_session()`` returns whichever kind of session applies.
+"""
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .events import note_events
+from .registry import DetectorPool, sessions
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerError(RuntimeError):
+    """A request could not be served by its worker process"""
+
+
+class ShardOverloaded(WorkerError):
+    """The session's shard already has a full queue"""
+
+
+def worker_main(conn, shm_name, index):
+    """Worker process loop: serve requests from ``conn`` until told to stop"""
+    outbox = []
+    pool = DetectorPool(publish=lambda session_id, event: outbox.append((session_id, event)))
+    shm = shared_memory.SharedMemory(name=shm_name)
+    logger.info("Worker %d started (pid %d)", index, os.getpid())
+    try:
+        while True:
+            try:
+                command, session_id, args = conn.recv()
+            except EOFError:
+                break
+            if command == 'stop':
+                break
+            try:
+                if command == 'analyze':
+                    instrument_type, timestamp, shape, dtype, payload = args
+                    if payload is None:
+                        frame = np.ndarray(shape, dtype, buffer=shm.buf)
+                    else:
+                        frame = np.frombuffer(payload, dtype).reshape(shape)
+                    result = pool.get(session_id, instrument_type).analyze_frame(frame, timestamp).as_dict()
+                    del frame  # Drop the view of the shared buffer before the next request
+                elif command == 'open':
+                    result = pool.get(session_id, *args).available_notes
+                elif command == 'scale':
+                    instrument_type, scale = args
+                    detector = pool.get(session_id, instrument_type)
+                    result = (detector.set_custom_scale(scale), detector.available_notes)
+                elif command == 'release':
+                    result = pool.release(session_id)
+                elif command == 'stats':
+                    result = pool.stats()
+                else:
+                    raise ValueError(f"Unknown worker command '{command}'")
+                conn.send(('ok', result, outbox[:]))
+            except Exception as e:
+                logger.exception("Worker %d failed on %s for %s", index, command, session_id)
+                conn.send(('error', f"{type(e).__name__}: {e}", outbox[:]))
+            outbox.clear()
+    finally:
+        shm.close()
+
+
+class Shard:
+    """One worker process, its bounded request queue and the thread that feeds it"""
+
+    def __init__(self, index, context, frame_bytes, max_queue, timeout):
+        self.index = index
+        self.context = context
+        self.timeout = timeout
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.restarts = 0
+        self.inline_frames = 0
+        self.busy = False
+        self.service_time = 0.0  # Smoothed seconds per request in the worker
+        self.wait_time = 0.0  # Smoothed seconds spent queued
+        self.sessions = set()
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes)
+        self.process = None
+        self.conn = None
+        self._queue = queue.Queue(max_queue)
+        self._feeder = threading.Thread(target=self._feed, name=f"shard-{index}", daemon=True)
+        self._feeder.start()
+
+    def submit(self, command, session_id, *args):
+        future = Future()
+        try:
+            self._queue.put_nowait((future, command, session_id, args, time.monotonic()))
+        except queue.Full:
+            self.rejected += 1
+            raise ShardOverloaded(f"Shard {self.index} has {self._queue.maxsize} requests queued")
+        self.submitted += 1
+        return future
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def _spawn(self):
+        if self.process is not None:
+            self.restarts += 1
+            logger.warning("Restarting worker %d (exit code %s)", self.index, self.process.exitcode)
+            self._terminate()
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(target=worker_main, args=(child_conn, self.shm.name, self.index),
+                                            name=f"leadzeppelin-worker-{self.index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.sessions.clear()
+
+    def _terminate(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(1)
+
+    def _feed(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, command, session_id, args, enqueued = item
+            if not future.set_running_or_notify_cancel():
+                continue  # The caller gave up while it was queued
+            started = time.monotonic()
+            self.wait_time += 0.1 * ((started - enqueued) - self.wait_time)
+            if started - enqueued > self.timeout:
+                self.expired += 1
+                future.set_exception(ShardOverloaded(f"Request waited over {self.timeout}s in shard {self.index}"))
+                continue
+            self.busy = True
+            try:
+                result = self._call(command, session_id, args)
+            except Exception as e:
+                self.failed += 1
+                future.set_exception(e)
+            else:
+                self.completed += 1
+                future.set_result(result)
+            finally:
+                self.service_time += 0.1 * ((time.monotonic() - started) - self.service_time)
+                self.busy = False
+
+    def _call(self, command, session_id, args):
+        if self.process is None or not self.process.is_alive():
+            self._spawn()
+        if command == 'analyze':
+            args = self._frame_args(*args)
+        try:
+            self.conn.send((command, session_id, args))
+            if not self.conn.poll(self.timeout):
+                raise WorkerError(f"Worker {self.index} did not answer within {self.timeout}s")
+            state, result, events = self.conn.recv()
+        except (EOFError, OSError, WorkerError) as e:
+            # The worker died or hung; it is replaced on the next request
+            self._terminate()
+            raise WorkerError(f"Worker {self.index} failed: {e}") from e
+
+        if command == 'release':
+            self.sessions.discard(session_id)
+        elif session_id is not None:
+            self.sessions.add(session_id)
+        for event_session, event in events:
+            note_events.publish(event_session, event)
+        if state == 'error':
+            raise WorkerError(result)
+        return result
+
+    def _frame_args(self, instrument_type, timestamp, frame):
+        """Put the frame in shared memory when it fits; otherwise send its bytes inline"""
+        frame = np.ascontiguousarray(frame)
+        if frame.nbytes <= self.shm.size:
+            np.ndarray(frame.shape, frame.dtype, buffer=self.shm.buf)[...] = frame
+            payload = None
+        else:
+            self.inline_frames += 1
+            payload = frame.tobytes()
+        return (instrument_type, timestamp, frame.shape, frame.dtype.str, payload)
+
+    def stop(self):
+        self._queue.put(None)
+        self._feeder.join()
+        if self.process is not None:
+            try:
+                self.conn.send(('stop', None, ()))
+            except OSError:
+                pass
+            self.process.join(2)
+            self._terminate()
+        self.shm.close()
+        self.shm.unlink()
+
+    def stats(self):
+        alive = self.process is not None and self.process.is_alive()
+        return {
+            'pid': self.process.pid if alive else None,
+            'alive': alive,
+            'restarts': self.restarts,
+            'queue_depth': self.depth,
+            'queue_limit': self._queue.maxsize,
+            'busy': self.busy,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'expired': self.expired,
+            'inline_frames': self.inline_frames,
+            'service_ms': self.service_time * 1000,
+            'wait_ms': self.wait_time * 1000,
+            'sessions': len(self.sessions),
+        }
+
+
+class ShardedExecutor:
+    """Routes each session to one of ``workers`` processes; started on first use"""
+
+    def __init__(self, workers=None, max_queue=None, frame_bytes=None, timeout=None):
+        self.workers = int(os.getenv('LEADZEPPELIN_WORKERS', '0')) if workers is None else workers
+        self.max_queue = max_queue or int(os.getenv('LEADZEPPELIN_WORKER_QUEUE', '8'))
+        # Room for one 1080p BGR frame per shard by default
+        self.frame_bytes = frame_bytes or int(os.getenv('LEADZEPPELIN_WORKER_FRAME_MB', '8')) * 1024 * 1024
+        self.timeout = timeout or float(os.getenv('LEADZEPPELIN_WORKER_TIMEOUT', '10'))
+        self._shards = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    def shard_index(self, session_id):
+        """Stable across processes and restarts, unlike ``hash()``"""
+        return zlib.crc32(session_id.encode()) % self.workers
+
+    def shard(self, session_id):
+        with self._lock:
+            if self._shards is None:
+                # Spawned workers do not inherit the web process's threads and locks
+                context = multiprocessing.get_context('spawn')
+                self._shards = [Shard(i, context, self.frame_bytes, self.max_queue, self.timeout)
+                                for i in range(self.workers)]
+                atexit.register(self.shutdown)
+            return self._shards[self.shard_index(session_id)]
+
+    def submit(self, command, session_id, *args):
+        """Future for ``command`` run in the session's worker, after its earlier requests"""
+        return self.shard(session_id).submit(command, session_id, *args)
+
+    def analyze(self, session_id, instrument_type, frame, timestamp):
+        return self.submit('analyze', session_id, instrument_type, timestamp, frame)
+
+    def call(self, command, session_id, *args):
+        """Run ``command`` for the session and wait for its result; every failure is a WorkerError"""
+        return self.wait(self.submit(command, session_id, *args))
+
+    def wait(self, future):
+        # Long enough for a full queue wait plus one worker call
+        try:
+            return future.result(self.timeout * 2)
+        except FutureTimeout:
+            if future.cancel():
+                raise ShardOverloaded(f"Request was still queued after {self.timeout * 2}s") from None
+            raise WorkerError(f"Worker did not answer within {self.timeout * 2}s") from None
+
+    def session_stats(self):
+        """Session pool stats of every started worker"""
+        with self._lock:
+            shards = list(self._shards or ())
+        stats = []
+        for shard in shards:
+            try:
+                stats.append(self.wait(shard.submit('stats', None)))
+            except WorkerError as e:
+                stats.append({'error': str(e)})
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            shards, self._shards = self._shards, None
+        for shard in shards or ():
+            shard.stop()
+
+    def stats(self):
+        with self._lock:
+            shards = list(self._shards or ())
+        return {
+            'workers': self.workers,
+            'started': bool(shards),
+            'queue_depth': sum(shard.depth for shard in shards),
+            'shards': [shard.stats() for shard in shards],
+        }
+
+
+class LocalSession:
+    """A client session served by a detector in this process"""
+
+    def __init__(self, session_id, instrument_type='piano'):
+        self.session_id = session_id
+        self.pool = sessions
+        with sessions.session(session_id, instrument_type) as detector:
+            self.instrument_type = detector.instrument_type
+            self.notes = list(detector.available_notes)
+
+    def analyze(self, frame, timestamp):
+        with self.pool.session(self.session_id, self.instrument_type) as detector:
+            return detector.analyze_frame(frame, timestamp).as_dict()
+
+    def set_scale(self, scale):
+        with self.pool.session(self.session_id, self.instrument_type) as detector:
+            ok = detector.set_custom_scale(scale)
+            self.notes = list(detector.available_notes)
+        return ok
+
+    def release(self):
+        self.pool.release(self.session_id)
+
+
+class WorkerSession:
+    """A client session served by its shard's worker process"""
+
+    def __init__(self, executor, session_id, instrument_type='piano'):
+        self.executor = executor
+        self.session_id = session_id
+        self.instrument_type = instrument_type
+        self.notes = self.call('open', instrument_type)
+
+    def call(self, command, *args):
+        return self.executor.call(command, self.session_id, *args)
+
+    def analyze(self, frame, timestamp):
+        return self.call('analyze', self.instrument_type, timestamp, frame)
+
+    def set_scale(self, scale):
+        ok, self.notes = self.call('scale', self.instrument_type, scale)
+        return ok
+
+    def release(self):
+        self.call('release')
+
+
+def open_session(session_id, instrument_type='piano'):
+    """Session handle for ``session_id``: in a worker process if workers are enabled"""
+    if executor.enabled:
+        return WorkerSession(executor, session_id, instrument_type)
+    return LocalSession(session_id, instrument_type)
+
+
+executor = ShardedExecutor()